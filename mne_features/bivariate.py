@@ -4,17 +4,15 @@
 
 
 from functools import partial
-from math import sqrt
+from warnings import warn
 
 import numpy as np
 from scipy import signal
-from scipy.spatial.distance import pdist, squareform
-from sklearn.base import clone
+from scipy.fftpack import next_fast_len
 from sklearn.neighbors import NearestNeighbors
-from sklearn.preprocessing import scale
 
-from .mock_numba import nb
-from .utils import triu_idx, power_spectrum, embed
+from .utils import (pairs_idx, power_spectrum, embed, memoize_epoch,
+                    _check_psd_params, _freq_bands_matrix)
 
 
 def get_bivariate_funcs(sfreq):
@@ -38,14 +36,22 @@ def get_bivariate_funcs(sfreq):
     bivariate_funcs['nonlin_interdep'] = compute_nonlinear_interdep
     bivariate_funcs['time_corr'] = compute_time_corr_coefs
     bivariate_funcs['spect_corr'] = partial(compute_spect_corr_coefs, sfreq)
+    bivariate_funcs['coherence'] = partial(compute_coherence, sfreq)
+    bivariate_funcs['imag_coherence'] = partial(compute_imag_coherence,
+                                                sfreq)
+    bivariate_funcs['band_plv'] = partial(compute_band_plv, sfreq)
     return bivariate_funcs
 
 
-@nb.jit([nb.float64[:](nb.float64, nb.float64[:, :]),
-         nb.float32[:](nb.float32, nb.float32[:, :])], nopython=True)
-def compute_max_cross_correlation(s_freq, data):
+def compute_max_cross_correlation(s_freq, data, pairs=None):
     """ Maximum linear cross-correlation [1, 2].
 
+    The cross-correlations are computed for the delays `0 <= tau <= n_tau`
+    (with `n_tau = int(0.5 * s_freq)`, in number of samples). They are
+    obtained, for all the pairs of channels, from the cross-spectra of the
+    normalized channels. Since only nonnegative delays are used, the feature
+    of the pair (i, j) is not, in general, equal to that of the pair (j, i).
+
     Parameters
     ----------
     s_freq : float
@@ -53,9 +59,17 @@ def compute_max_cross_correlation(s_freq, data):
 
     data : ndarray, shape (n_channels, n_times)
 
+    pairs : array-like or None (default: None)
+        Pairs of channels for which the feature is computed: either a list of
+        pairs of channel indices, of shape (n_pairs, 2), or a boolean
+        adjacency matrix of shape (n_channels, n_channels) (see
+        `utils.pairs_idx`). If None, all the pairs (i, j) with i <= j are
+        used.
+
     Returns
     -------
-    output : ndarray, shape (n_channels * (n_channels + 1) / 2,)
+    output : ndarray, shape (n_pairs,)
+        With, n_pairs = n_channels * (n_channels + 1) / 2 if `pairs` is None.
 
     References
     ----------
@@ -67,76 +81,90 @@ def compute_max_cross_correlation(s_freq, data):
            Machine Learning for Signal Processing, 2008.
            IEEE Workshop on (pp. 244-249). IEEE.
     """
-
     n_channels, n_times = data.shape
-    n_tau = int(0.5 * s_freq)
-    taus = np.arange(-n_tau, n_tau)
-    n_coefs = n_channels * (n_channels + 1) // 2
-    max_cc = np.empty((n_coefs,), dtype=data.dtype)
-    for s, k, l in triu_idx(n_channels):
-        max_cc_ij = np.empty((2 * n_tau,))
-        for tau in taus:
-            if tau < 0:
-                _tau = -tau
-            else:
-                _tau = tau
-            x_m = 0
-            y_m = 0
-            for j in range(n_times):
-                x_m += data[k, j]
-                y_m += data[l, j]
-            x_m /= n_times
-            y_m /= n_times
-            x_v = 0
-            y_v = 0
-            for j in range(n_times):
-                x_v += (data[k, j] - x_m) * (data[k, j] - x_m)
-                y_v += (data[l, j] - y_m) * (data[l, j] - y_m)
-            x_v /= (n_times - 1)
-            y_v /= (n_times - 1)
-            x_v = sqrt(x_v)
-            y_v = sqrt(y_v)
-            cc = 0
-            for j in range(0, n_times - _tau):
-                cc += ((data[k, j + _tau] - x_m) / x_v) * ((data[l, j] -
-                                                            y_m) / y_v)
-            cc /= (n_times - _tau)
-            max_cc_ij[tau + n_tau] = abs(cc)
-        max_cc[s] = np.max(max_cc_ij)
+    n_tau = min(int(0.5 * s_freq), n_times - 1)
+    rows, cols = pairs_idx(n_channels, pairs)
+    max_cc = np.empty(rows.shape, dtype=data.dtype)
+    # Only the channels involved in (at least) one pair are transformed
+    chans, inv = np.unique(np.r_[rows, cols], return_inverse=True)
+    _rows, _cols = inv[:rows.size], inv[rows.size:]
+    _data = data[chans] - np.mean(data[chans], axis=-1)[:, None]
+    _data /= np.std(data[chans], axis=-1, ddof=1)[:, None]
+    # Zero-padding avoids the circular wrap-around for the delays
+    # 0 <= tau <= n_tau
+    n_fft = next_fast_len(n_times + n_tau)
+    data_fft = np.fft.rfft(_data, n_fft, axis=-1)
+    n_overlap = n_times - np.arange(n_tau + 1)
+    for k in np.unique(_rows):
+        # Cross-correlations between channel k and the channels paired
+        # with it
+        mask = _rows == k
+        cc = np.fft.irfft(data_fft[k] * np.conj(data_fft[_cols[mask]]), n_fft,
+                          axis=-1)[:, :(n_tau + 1)]
+        max_cc[mask] = np.max(np.abs(cc / n_overlap), axis=-1)
     return max_cc
 
 
-def compute_phase_locking_value(data):
+def compute_phase_locking_value(data, pairs=None):
     """ Phase Locking Value (PLV) [1].
 
     Parameters
     ----------
     data : ndarray, shape (n_channels, n_times)
 
+    pairs : array-like or None (default: None)
+        Pairs of channels for which the feature is computed: either a list of
+        pairs of channel indices, of shape (n_pairs, 2), or a boolean
+        adjacency matrix of shape (n_channels, n_channels) (see
+        `utils.pairs_idx`). If None, all the pairs (i, j) with i <= j are
+        used.
+
     Returns
     -------
-    output : ndarray, shape (n_channels * (n_channels + 1) / 2,)
+    output : ndarray, shape (n_pairs,)
+        With, n_pairs = n_channels * (n_channels + 1) / 2 if `pairs` is None.
 
     References
     ----------
     .. [1] http://www.gatsby.ucl.ac.uk/~vincenta/kaggle/report.pdf
     """
     n_channels, n_times = data.shape
-    n_coefs = n_channels * (n_channels + 1) // 2
-    plv = np.empty((n_coefs,))
-    for s, i, j in triu_idx(n_channels):
-        if i == j:
-            plv[j] = 1
-        else:
-            xa = signal.hilbert(data[i, :])
-            ya = signal.hilbert(data[j, :])
-            phi_x = np.angle(xa)
-            phi_y = np.angle(ya)
-            plv[s] = np.absolute(np.mean(np.exp(1j * (phi_x - phi_y))))
+    if pairs is None:
+        # Unit phasors of the analytic signals (computed once per channel)
+        phasors = np.exp(1j * np.angle(signal.hilbert(data, axis=-1)))
+        plv = np.abs(np.dot(phasors, np.conj(phasors).T)) / n_times
+        np.fill_diagonal(plv, 1.)
+        return plv[np.triu_indices(n_channels)]
+    rows, cols = pairs_idx(n_channels, pairs)
+    chans, inv = np.unique(np.r_[rows, cols], return_inverse=True)
+    _rows, _cols = inv[:rows.size], inv[rows.size:]
+    phasors = np.exp(1j * np.angle(signal.hilbert(data[chans], axis=-1)))
+    plv = np.abs(np.einsum('ij,ij->i', phasors[_rows],
+                           np.conj(phasors[_cols]))) / n_times
+    plv[rows == cols] = 1.
     return plv
 
 
-def compute_nonlinear_interdep(data, tau=2, emb=10, nn=5):
+def _mean_sq_dist(x, idx):
+    """ Utility function which returns the mean squared Euclidean distance
+    between the points of x and their neighbours (given by idx). The
+    distances are only evaluated for the pairs of points in idx.
+
+    Parameters
+    ----------
+    x : ndarray, shape (n_points, n_dims)
+
+    idx : ndarray, shape (n_points, n_neighbors)
+        Indices (in x) of the neighbours of each point of x.
+
+    Returns
+    -------
+    float
+    """
+    return np.mean(np.sum((x[idx] - x[:, None, :]) ** 2, axis=-1))
+
+
+def compute_nonlinear_interdep(data, tau=2, emb=10, nn=5, pairs=None):
     """ Measure of nonlinear interdependence [1, 2].
 
     Parameters
@@ -152,9 +180,17 @@ def compute_nonlinear_interdep(data, tau=2, emb=10, nn=5):
     nn : int (default: 5)
         Number of Nearest Neighbours.
 
+    pairs : array-like or None (default: None)
+        Pairs of channels for which the feature is computed: either a list of
+        pairs of channel indices, of shape (n_pairs, 2), or a boolean
+        adjacency matrix of shape (n_channels, n_channels) (see
+        `utils.pairs_idx`). If None, all the pairs (i, j) with i <= j are
+        used.
+
     Returns
     -------
-    ndarray, shape (n_channels * (n_channels + 1) / 2,)
+    output : ndarray, shape (n_pairs,)
+        With, n_pairs = n_channels * (n_channels + 1) / 2 if `pairs` is None.
 
     References
     ----------
@@ -166,64 +202,124 @@ def compute_nonlinear_interdep(data, tau=2, emb=10, nn=5):
            In Machine Learning for Signal Processing. IEEE. pp. 244-249.
     """
     n_channels, n_times = data.shape
-    n_coefs = n_channels * (n_channels + 1) // 2
-    nlinterdep = np.empty((n_coefs,))
-    for s, i, j in triu_idx(n_channels):
-        emb_x = embed(data[i, :], d=emb, tau=tau)
-        emb_y = embed(data[j, :], d=emb, tau=tau)
-        knn = NearestNeighbors(n_neighbors=nn, algorithm='kd_tree')
-        idx_x = clone(knn).fit(emb_x).kneighbors(emb_x, return_distance=False)
-        idx_y = clone(knn).fit(emb_y).kneighbors(emb_y, return_distance=False)
-        gx = squareform(pdist(emb_x, metric='sqeuclidean'))
-        gy = squareform(pdist(emb_y, metric='sqeuclidean'))
-        nr = gx.shape[0]
-        rx = np.mean(np.vstack([gx[j, idx_x[j, :]] for j in range(nr)]))
-        rxy = np.mean(np.vstack([gx[j, idx_y[j, :]] for j in range(nr)]))
-        ry = np.mean(np.vstack([gy[j, idx_y[j, :]] for j in range(nr)]))
-        ryx = np.mean(np.vstack([gy[j, idx_x[j, :]] for j in range(nr)]))
-        sxy = np.mean(np.divide(rx, rxy))
-        syx = np.mean(np.divide(ry, ryx))
+    rows, cols = pairs_idx(n_channels, pairs)
+    nlinterdep = np.empty(rows.shape)
+    # Embeddings and nearest neighbours are computed once per channel (and
+    # only for the channels involved in at least one pair)
+    knn = NearestNeighbors(n_neighbors=nn, algorithm='kd_tree')
+    emb_data, idx, r = dict(), dict(), dict()
+    for j in np.unique(np.r_[rows, cols]):
+        emb_data[j] = embed(data[j, :], d=emb, tau=tau)
+        idx[j] = knn.fit(emb_data[j]).kneighbors(
+            emb_data[j], return_distance=False)
+        r[j] = _mean_sq_dist(emb_data[j], idx[j])
+    for s, (i, j) in enumerate(zip(rows, cols)):
+        rxy = _mean_sq_dist(emb_data[i], idx[j])
+        ryx = _mean_sq_dist(emb_data[j], idx[i])
+        sxy = np.divide(r[i], rxy)
+        syx = np.divide(r[j], ryx)
         nlinterdep[s] = sxy + syx
     return nlinterdep
 
 
-def compute_time_corr_coefs(data, with_eigenvalues=True):
+def _corr_coefs(x, with_eigenvalues=True, pairs=None):
+    """ Utility function which returns the upper triangular part of the
+    correlation matrix of the rows of x (and, optionally, the eigenvalues of
+    the correlation matrix). As in [1], each column of x is standardized
+    before computing the correlation matrix.
+
+    The correlation matrices of a batch of epochs are computed with stacked
+    matrix products and their eigenvalues with a symmetric eigensolver.
+
+    Parameters
+    ----------
+    x : ndarray, shape (..., n_channels, n_features)
+
+    with_eigenvalues : bool (default: True)
+        If True, the function also returns the eigenvalues (in absolute value
+        and sorted) of the correlation matrix.
+
+    pairs : array-like or None (default: None)
+        Pairs of channels for which the correlation coefficients are returned
+        (see `utils.pairs_idx`). If None, all the pairs (i, j) with i <= j
+        are used.
+
+    Returns
+    -------
+    output : ndarray, shape (..., n_out)
+        If `with_eigenvalues` is True, n_out = n_pairs + n_channels.
+        Otherwise, n_out = n_pairs.
+
+    References
+    ----------
+    .. [1] https://kaggle2.blob.core.windows.net/forum-message-attachments/
+           134445/4803/seizure-detection.pdf
+    """
+    n_channels = x.shape[-2]
+    rows, cols = pairs_idx(n_channels, pairs)
+    # Same as `sklearn.preprocessing.scale(x, axis=0)`, on the last but one
+    # axis
+    std = np.std(x, axis=-2, keepdims=True)
+    std[std == 0] = 1.
+    _scaled = (x - np.mean(x, axis=-2, keepdims=True)) / std
+    # Same as `np.corrcoef(_scaled)`, on the last two axes
+    _scaled -= np.mean(_scaled, axis=-1, keepdims=True)
+    if not with_eigenvalues and pairs is not None:
+        # Only the requested entries of the correlation matrix are computed
+        d = np.sqrt(np.sum(_scaled ** 2, axis=-1))
+        coefs = np.sum(_scaled[..., rows, :] * _scaled[..., cols, :], axis=-1)
+        coefs /= d[..., rows] * d[..., cols]
+        return np.clip(coefs, -1, 1)
+    corr = np.matmul(_scaled, np.swapaxes(_scaled, -1, -2))
+    d = np.sqrt(np.diagonal(corr, axis1=-2, axis2=-1))
+    corr /= d[..., :, None]
+    corr /= d[..., None, :]
+    np.clip(corr, -1, 1, out=corr)
+    coefs = corr[..., rows, cols]
+    if with_eigenvalues:
+        w = np.sort(np.abs(np.linalg.eigvalsh(corr)), axis=-1)
+        return np.concatenate((coefs, w), axis=-1)
+    else:
+        return coefs
+
+
+def compute_time_corr_coefs(data, with_eigenvalues=True, pairs=None):
     """ Correlation Coefficients (computed in the time domain) [1].
 
     Parameters
     ----------
     data : ndarray, shape (n_channels, n_times)
+        The features can also be computed for a batch of epochs at once, by
+        passing data of shape (n_epochs, n_channels, n_times).
 
     with_eigenvalues : bool (default: True)
         If True, the function also returns the eigenvalues of the correlation
         matrix.
 
+    pairs : array-like or None (default: None)
+        Pairs of channels for which the correlation coefficients are computed
+        (see `utils.pairs_idx`). If None, all the pairs (i, j) with i <= j
+        are used. The eigenvalues (if `with_eigenvalues` is True) are those
+        of the full correlation matrix.
+
     Returns
     -------
     output : ndarray, shape (n_out,)
-        If `with_eigenvalues` is True, n_out = n_coefs + n_channels (with:
-        n_coefs = n_channels * (n_channels + 1) // 2). Otherwise,
-        n_out = n_coefs.
+        If `with_eigenvalues` is True, n_out = n_pairs + n_channels (with:
+        n_pairs = n_channels * (n_channels + 1) // 2 if `pairs` is None).
+        Otherwise, n_out = n_pairs. If `data` is a batch of epochs, the shape
+        of the output is (n_epochs, n_out).
 
     References
     ----------
     .. [1] https://kaggle2.blob.core.windows.net/forum-message-attachments/
            134445/4803/seizure-detection.pdf
     """
-    n_channels = data.shape[0]
-    _scaled = scale(data, axis=0)
-    corr = np.corrcoef(_scaled)
-    coefs = corr[np.triu_indices(n_channels)]
-    if with_eigenvalues:
-        w, _ = np.linalg.eig(corr)
-        w = np.abs(w)
-        w = np.sort(w)
-        return np.r_[coefs, w]
-    else:
-        return coefs
+    return _corr_coefs(data, with_eigenvalues, pairs)
 
 
-def compute_spect_corr_coefs(sfreq, data, db=True, with_eigenvalues=True):
+def compute_spect_corr_coefs(sfreq, data, db=True, with_eigenvalues=True,
+                             psd_method='fft', psd_params=None, pairs=None):
     """ Correlation Coefficients (computed from the power spectrum) [1].
 
     Parameters
@@ -232,6 +328,8 @@ def compute_spect_corr_coefs(sfreq, data, db=True, with_eigenvalues=True):
         Sampling rate of the data.
 
     data : ndarray, shape (n_channels, n_times)
+        The features can also be computed for a batch of epochs at once, by
+        passing data of shape (n_epochs, n_channels, n_times).
 
     db : bool (default: True)
         If True, the power spectrum returned by the function
@@ -241,26 +339,360 @@ def compute_spect_corr_coefs(sfreq, data, db=True, with_eigenvalues=True):
         If True, the function also returns the eigenvalues of the correlation
         matrix.
 
+    psd_method : str (default: 'fft')
+        Method used for the estimation of the Power Spectrum: 'fft', 'welch'
+        or 'multitaper' (see `utils.power_spectrum`).
+
+    psd_params : dict or None (default: None)
+        If not None, dict of parameters of the PSD estimation method (see
+        `utils.power_spectrum`).
+
+    pairs : array-like or None (default: None)
+        Pairs of channels for which the correlation coefficients are computed
+        (see `utils.pairs_idx`). If None, all the pairs (i, j) with i <= j
+        are used. The eigenvalues (if `with_eigenvalues` is True) are those
+        of the full correlation matrix.
+
     Returns
     -------
     output : ndarray, shape (n_out,)
-        If `with_eigenvalues` is True, n_out = n_coefs + n_channels. Otherwise,
-        n_out = n_coefs. With, n_coefs = n_channels * (n_channels + 1) // 2.
+        If `with_eigenvalues` is True, n_out = n_pairs + n_channels. Otherwise,
+        n_out = n_pairs. With, n_pairs = n_channels * (n_channels + 1) // 2 if
+        `pairs` is None.
+        If `data` is a batch of epochs, the shape of the output is
+        (n_epochs, n_out).
 
     References
     ----------
     .. [1] https://kaggle2.blob.core.windows.net/forum-message-attachments/
            134445/4803/seizure-detection.pdf
     """
-    n_channels = data.shape[0]
-    ps, _ = power_spectrum(sfreq, data, return_db=db)
-    _scaled = scale(ps, axis=0)
-    corr = np.corrcoef(_scaled)
-    coefs = corr[np.triu_indices(n_channels)]
-    if with_eigenvalues:
-        w, _ = np.linalg.eig(corr)
-        w = np.abs(w)
-        w = np.sort(w)
-        return np.r_[coefs, w]
-    else:
-        return coefs
+    ps, _ = power_spectrum(sfreq, data, return_db=db, psd_method=psd_method,
+                           psd_params=psd_params)
+    return _corr_coefs(ps, with_eigenvalues, pairs)
+
+
+@memoize_epoch
+def _segment_spectra(data, sfreq, psd_params):
+    """ Utility function which returns the Fourier coefficients of the
+    (detrended and windowed) overlapping segments of each channel, as in
+    Welch's method. They are shared by the cross-spectral feature functions.
+
+    Parameters
+    ----------
+    data : ndarray, shape (n_channels, n_times)
+
+    sfreq : float
+        Sampling rate of the data.
+
+    psd_params : tuple
+        Output of `utils._check_psd_params` (for the method 'welch').
+
+    Returns
+    -------
+    coefs : ndarray, shape (n_freqs, n_channels, n_segments)
+
+    freqs : ndarray, shape (n_freqs,)
+    """
+    n_times = data.shape[-1]
+    params = dict(psd_params)
+    n_per_seg = min(params['n_per_seg'], n_times)
+    n_overlap = params['n_overlap']
+    if n_overlap is None:
+        n_overlap = n_per_seg // 2
+    starts = np.arange(0, n_times - n_per_seg + 1, n_per_seg - n_overlap)
+    segments = data[:, starts[:, None] + np.arange(n_per_seg)]
+    segments = segments - np.mean(segments, axis=-1)[..., None]
+    segments *= signal.get_window(params['window'], n_per_seg)
+    coefs = np.fft.rfft(segments, axis=-1).transpose(2, 0, 1)
+    freqs = np.fft.rfftfreq(n_per_seg, 1. / sfreq)
+    return coefs, freqs
+
+
+def _average_cross_spectra(coefs):
+    """ Utility function which returns, for each frequency bin, the matrix of
+    the cross-spectra of the channels averaged over the segments.
+
+    Parameters
+    ----------
+    coefs : ndarray, shape (n_freqs, n_channels, n_segments)
+
+    Returns
+    -------
+    output : ndarray, shape (n_freqs, n_channels, n_channels)
+    """
+    csd = np.matmul(coefs, np.conj(np.swapaxes(coefs, -1, -2)))
+    csd /= coefs.shape[-1]
+    return csd
+
+
+@memoize_epoch
+def _cross_spectral_density(data, sfreq, psd_params):
+    """ Utility function which returns the cross-spectral density matrix (up
+    to a constant scaling factor) of the channels, for each frequency bin. It
+    is computed once per epoch and shared by `compute_coherence` and
+    `compute_imag_coherence` (and by all the frequency bands).
+
+    Parameters
+    ----------
+    data : ndarray, shape (n_channels, n_times)
+
+    sfreq : float
+        Sampling rate of the data.
+
+    psd_params : tuple
+        Output of `utils._check_psd_params` (for the method 'welch').
+
+    Returns
+    -------
+    csd : ndarray, shape (n_freqs, n_channels, n_channels)
+
+    freqs : ndarray, shape (n_freqs,)
+    """
+    coefs, freqs = _segment_spectra(data, sfreq, psd_params)
+    return _average_cross_spectra(coefs), freqs
+
+
+@memoize_epoch
+def _phase_cross_spectral_density(data, sfreq, psd_params):
+    """ Utility function which returns the matrix of the cross-spectra
+    normalized to unit modulus (and averaged over the segments) of the
+    channels, for each frequency bin. Its modulus is the Phase Locking Value.
+
+    Parameters
+    ----------
+    data : ndarray, shape (n_channels, n_times)
+
+    sfreq : float
+        Sampling rate of the data.
+
+    psd_params : tuple
+        Output of `utils._check_psd_params` (for the method 'welch').
+
+    Returns
+    -------
+    csd : ndarray, shape (n_freqs, n_channels, n_channels)
+
+    freqs : ndarray, shape (n_freqs,)
+    """
+    coefs, freqs = _segment_spectra(data, sfreq, psd_params)
+    mag = np.abs(coefs)
+    return _average_cross_spectra(coefs / np.where(mag == 0, 1., mag)), freqs
+
+
+def _band_average(sfreq, x, freqs, freq_bands):
+    """ Utility function which averages a frequency-resolved bivariate
+    feature over the frequency bins of each frequency band.
+
+    Parameters
+    ----------
+    sfreq : float
+        Sampling rate of the data.
+
+    x : ndarray, shape (n_freqs, n_pairs)
+
+    freqs : ndarray, shape (n_freqs,)
+
+    freq_bands : ndarray, shape (n_bands + 1,)
+
+    Returns
+    -------
+    output : ndarray, shape (n_pairs * n_bands,)
+    """
+    n_fft = int(round(sfreq / freqs[1]))
+    bands = _freq_bands_matrix(float(sfreq), n_fft,
+                               tuple(np.asarray(freq_bands, float).tolist()))
+    n_bins = np.sum(bands, axis=0)
+    if np.any(n_bins == 0):
+        warn('Some frequency bands contain no frequency bin (the frequency '
+             'resolution is %.2f Hz): the corresponding features are NaN. '
+             'Use larger segments (`n_per_seg`) or wider frequency bands.' %
+             freqs[1])
+    with np.errstate(invalid='ignore'):
+        # The average is NaN for the bands which contain no frequency bin
+        return (np.dot(x.T, bands) / n_bins).ravel()
+
+
+def _coherency(sfreq, data, psd_params, pairs):
+    """ Utility function which returns the (complex-valued) coherency of the
+    given pairs of channels, for each frequency bin.
+
+    Parameters
+    ----------
+    sfreq : float
+        Sampling rate of the data.
+
+    data : ndarray, shape (n_channels, n_times)
+
+    psd_params : dict or None
+        Parameters of Welch's method (see `utils.power_spectrum`).
+
+    pairs : array-like or None
+        Pairs of channels (see `utils.pairs_idx`).
+
+    Returns
+    -------
+    coh : ndarray, shape (n_freqs, n_pairs)
+
+    freqs : ndarray, shape (n_freqs,)
+    """
+    rows, cols = pairs_idx(data.shape[0], pairs)
+    csd, freqs = _cross_spectral_density(
+        data, float(sfreq), _check_psd_params('welch', psd_params))
+    psd = np.real(np.diagonal(csd, axis1=-2, axis2=-1))
+    coh = csd[:, rows, cols] / np.sqrt(psd[:, rows] * psd[:, cols])
+    return coh, freqs
+
+
+def compute_coherence(sfreq, data,
+                      freq_bands=np.array([0.5, 4., 8., 13., 30., 100.]),
+                      psd_params=None, pairs=None):
+    """ Coherence (computed by frequency bands) [1].
+
+    For each pair of channels, the coherence is computed in each frequency
+    bin from the cross-spectral density matrix (estimated with Welch's
+    method) and averaged over the frequency bins of each band. The
+    cross-spectral density matrix is computed once per epoch and shared with
+    `compute_imag_coherence`.
+
+    Parameters
+    ----------
+    sfreq : float
+        Sampling rate of the data.
+
+    data : ndarray, shape (n_channels, n_times)
+
+    freq_bands : ndarray, shape (n_freqs,)
+        (default: np.array([0.5, 4., 8., 13., 30., 100.]))
+        Array defining the frequency bands. The j-th frequency band is defined
+        as: [freq_bands[j], freq_bands[j + 1]] (0 <= j <= n_freqs - 1).
+
+    psd_params : dict or None (default: None)
+        If not None, dict of parameters of Welch's method (see
+        `utils.power_spectrum`). The data should contain several segments of
+        `n_per_seg` samples (with a single segment, the coherence is equal to
+        1). The frequency resolution is `sfreq / n_per_seg`: the features of
+        the frequency bands which contain no frequency bin are NaN (and a
+        warning is emitted).
+
+    pairs : array-like or None (default: None)
+        Pairs of channels for which the feature is computed: either a list of
+        pairs of channel indices, of shape (n_pairs, 2), or a boolean
+        adjacency matrix of shape (n_channels, n_channels) (see
+        `utils.pairs_idx`). If None, all the pairs (i, j) with i <= j are
+        used.
+
+    Returns
+    -------
+    output : ndarray, shape (n_pairs * (n_freqs - 1),)
+        With, n_pairs = n_channels * (n_channels + 1) / 2 if `pairs` is None.
+
+    References
+    ----------
+    .. [1] Nolte, G. et al. (2004). Identifying true brain interaction from
+           EEG data using the imaginary part of coherency. Clinical
+           Neurophysiology, 115(10), 2292-2307.
+    """
+    coh, freqs = _coherency(sfreq, data, psd_params, pairs)
+    return _band_average(sfreq, np.abs(coh), freqs, freq_bands)
+
+
+def compute_imag_coherence(sfreq, data,
+                           freq_bands=np.array([0.5, 4., 8., 13., 30., 100.]),
+                           psd_params=None, pairs=None):
+    """ Imaginary part of the coherency (computed by frequency bands) [1].
+
+    Unlike the coherence, the imaginary part of the coherency is not
+    sensitive to the interactions with zero lag (volume conduction). See
+    `compute_coherence` for the details of the computation.
+
+    Parameters
+    ----------
+    sfreq : float
+        Sampling rate of the data.
+
+    data : ndarray, shape (n_channels, n_times)
+
+    freq_bands : ndarray, shape (n_freqs,)
+        (default: np.array([0.5, 4., 8., 13., 30., 100.]))
+        Array defining the frequency bands. The j-th frequency band is defined
+        as: [freq_bands[j], freq_bands[j + 1]] (0 <= j <= n_freqs - 1).
+
+    psd_params : dict or None (default: None)
+        If not None, dict of parameters of Welch's method (see
+        `utils.power_spectrum`). As for `compute_coherence`, the features of
+        the frequency bands which contain no frequency bin (the frequency
+        resolution is `sfreq / n_per_seg`) are NaN.
+
+    pairs : array-like or None (default: None)
+        Pairs of channels for which the feature is computed: either a list of
+        pairs of channel indices, of shape (n_pairs, 2), or a boolean
+        adjacency matrix of shape (n_channels, n_channels) (see
+        `utils.pairs_idx`). If None, all the pairs (i, j) with i <= j are
+        used.
+
+    Returns
+    -------
+    output : ndarray, shape (n_pairs * (n_freqs - 1),)
+        With, n_pairs = n_channels * (n_channels + 1) / 2 if `pairs` is None.
+
+    References
+    ----------
+    .. [1] Nolte, G. et al. (2004). Identifying true brain interaction from
+           EEG data using the imaginary part of coherency. Clinical
+           Neurophysiology, 115(10), 2292-2307.
+    """
+    coh, freqs = _coherency(sfreq, data, psd_params, pairs)
+    return _band_average(sfreq, np.imag(coh), freqs, freq_bands)
+
+
+def compute_band_plv(sfreq, data,
+                     freq_bands=np.array([0.5, 4., 8., 13., 30., 100.]),
+                     psd_params=None, pairs=None):
+    """ Phase Locking Value (computed by frequency bands) [1].
+
+    In each frequency bin, the Phase Locking Value is the modulus of the
+    average, over the segments used by Welch's method, of the cross-spectra
+    normalized to unit modulus. It is then averaged over the frequency bins
+    of each band. The Fourier coefficients of the segments are shared with
+    `compute_coherence` and `compute_imag_coherence`.
+
+    Parameters
+    ----------
+    sfreq : float
+        Sampling rate of the data.
+
+    data : ndarray, shape (n_channels, n_times)
+
+    freq_bands : ndarray, shape (n_freqs,)
+        (default: np.array([0.5, 4., 8., 13., 30., 100.]))
+        Array defining the frequency bands. The j-th frequency band is defined
+        as: [freq_bands[j], freq_bands[j + 1]] (0 <= j <= n_freqs - 1).
+
+    psd_params : dict or None (default: None)
+        If not None, dict of parameters of Welch's method (see
+        `utils.power_spectrum`). As for `compute_coherence`, the features of
+        the frequency bands which contain no frequency bin (the frequency
+        resolution is `sfreq / n_per_seg`) are NaN.
+
+    pairs : array-like or None (default: None)
+        Pairs of channels for which the feature is computed: either a list of
+        pairs of channel indices, of shape (n_pairs, 2), or a boolean
+        adjacency matrix of shape (n_channels, n_channels) (see
+        `utils.pairs_idx`). If None, all the pairs (i, j) with i <= j are
+        used.
+
+    Returns
+    -------
+    output : ndarray, shape (n_pairs * (n_freqs - 1),)
+        With, n_pairs = n_channels * (n_channels + 1) / 2 if `pairs` is None.
+
+    References
+    ----------
+    .. [1] Lachaux, J.-P. et al. (1999). Measuring phase synchrony in brain
+           signals. Human Brain Mapping, 8(4), 194-208.
+    """
+    rows, cols = pairs_idx(data.shape[0], pairs)
+    csd, freqs = _phase_cross_spectral_density(
+        data, float(sfreq), _check_psd_params('welch', psd_params))
+    return _band_average(sfreq, np.abs(csd[:, rows, cols]), freqs, freq_bands)
@@ -0,0 +1,326 @@
+# Author: Jean-Baptiste Schiratti <jean.baptiste.schiratti@gmail.com>
+#         Alexandre Gramfort <alexandre.gramfort@inria.fr>
+# License: BSD 3 clause
+
+
+""" Command line interface: extraction of features from a set of recordings
+(FIF or EDF/BDF files), with one output file per recording.
+
+Example::
+
+    $ mne-features "data/*.edf" --funcs mean ptp_amplitude pow_freq_bands \\
+          --duration 2. --overlap 1. --output-dir features --n-jobs 4
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import os.path as op
+import sys
+from glob import glob
+
+import numpy as np
+import pandas as pd
+import mne
+from sklearn.externals import joblib
+
+from .feature_extraction import extract_features, _check_max_memory
+
+
+_readers = {'.fif': mne.io.read_raw_fif, '.fif.gz': mne.io.read_raw_fif,
+            '.edf': mne.io.read_raw_edf, '.bdf': mne.io.read_raw_edf}
+
+_extensions = {'parquet': '.parquet', 'arrow': '.arrow', 'hdf5': '.h5'}
+
+
+def _split_ext(fname):
+    """ Utility function which splits a file name into its base name and its
+    extension (the extension '.fif.gz' is supported).
+
+    Parameters
+    ----------
+    fname : str
+
+    Returns
+    -------
+    base : str
+
+    ext : str
+    """
+    if fname.lower().endswith('.fif.gz'):
+        return fname[:-7], fname[-7:].lower()
+    base, ext = op.splitext(fname)
+    return base, ext.lower()
+
+
+def _get_epochs_data(fname, duration, overlap, ch_types):
+    """ Utility function which reads a recording and returns the data of the
+    fixed-length epochs extracted from it.
+
+    Parameters
+    ----------
+    fname : str
+        Path to a FIF or an EDF/BDF file.
+
+    duration : float
+        Duration of the epochs (in seconds).
+
+    overlap : float
+        Overlap between consecutive epochs (in seconds).
+
+    ch_types : list of str
+        Types of the channels used for the feature extraction (see
+        `mne.pick_types`). The bad channels are excluded.
+
+    Returns
+    -------
+    data : ndarray, shape (n_epochs, n_channels, n_times)
+
+    sfreq : float
+        Sampling rate of the data.
+    """
+    ext = _split_ext(fname)[1]
+    if ext not in _readers:
+        raise ValueError('Cannot read %s. Valid extensions are: %s.' %
+                         (fname, sorted(_readers.keys())))
+    raw = _readers[ext](fname, preload=False, verbose=False)
+    sfreq = raw.info['sfreq']
+    n_times = int(round(duration * sfreq))
+    step = n_times - int(round(overlap * sfreq))
+    if n_times <= 0 or step <= 0:
+        raise ValueError('The duration of the epochs should be positive and '
+                         'larger than their overlap.')
+    onsets = np.arange(0, raw.n_times - n_times + 1, step) + raw.first_samp
+    events = np.c_[onsets, np.zeros_like(onsets), np.ones_like(onsets)]
+    picks = mne.pick_types(raw.info, exclude='bads',
+                           **{ch_type: True for ch_type in ch_types})
+    epochs = mne.Epochs(raw, events, tmin=0., tmax=(n_times - 1) / sfreq,
+                        picks=picks, baseline=None, preload=True,
+                        reject_by_annotation=True, verbose=False)
+    return epochs.get_data(), sfreq
+
+
+def _process_file(fname, output_file, selected_funcs, funcs_params,
+                  duration, overlap, ch_types, chunk_size, checkpoint_dir,
+                  on_error, max_memory):
+    """ Utility function which extracts the features of a recording and
+    writes them to `output_file` (run in a worker process). If errors
+    occurred during the extraction (see the parameter `on_error` of
+    `extract_features`), they are written to a CSV file next to
+    `output_file`. If `max_memory` (in bytes) is not None, the memory used
+    by the data of the recording is subtracted from it and the rest is
+    passed to `extract_features`.
+
+    Returns
+    -------
+    n_epochs : int
+        Number of epochs extracted from the recording.
+
+    n_errors : int
+        Number of errors which occurred during the extraction.
+    """
+    data, sfreq = _get_epochs_data(fname, duration, overlap, ch_types)
+    if data.shape[0] == 0:
+        raise ValueError('No epoch could be extracted from %s.' % fname)
+    if max_memory is not None:
+        if data.nbytes >= max_memory:
+            raise ValueError('The data of the recording (%d bytes) does not '
+                             'fit in the memory budget (%d bytes).' %
+                             (data.nbytes, max_memory))
+        max_memory -= data.nbytes
+    error_log = list()
+    extract_features(data, sfreq, selected_funcs, funcs_params,
+                     output_file=output_file, chunk_size=chunk_size,
+                     checkpoint_dir=checkpoint_dir, on_error=on_error,
+                     error_log=error_log, max_memory=max_memory)
+    if error_log:
+        errors = pd.DataFrame(error_log, columns=['epoch', 'alias', 'error'])
+        errors.to_csv(_split_ext(output_file)[0] + '_errors.csv', index=False)
+    return data.shape[0], len(error_log)
+
+
+def _try_process_file(*args):
+    """ Utility function which calls `_process_file` and catches its errors,
+    so that a failed recording does not stop the processing of the others.
+
+    Returns
+    -------
+    output : tuple or None
+        Output of `_process_file` (None if it failed).
+
+    error : str or None
+        Description of the error (None if `_process_file` succeeded).
+    """
+    try:
+        return _process_file(*args), None
+    except Exception as e:
+        return None, '%s: %s' % (type(e).__name__, e)
+
+
+def _read_config(fname):
+    """ Utility function which reads the feature configuration (JSON file).
+
+    The configuration is a dict with the keys 'selected_funcs' (list of
+    aliases of feature functions) and, optionally, 'funcs_params' (see
+    `extract_features`).
+
+    Parameters
+    ----------
+    fname : str
+
+    Returns
+    -------
+    selected_funcs : list of str
+
+    funcs_params : dict or None
+    """
+    with open(fname, 'r') as fid:
+        config = json.load(fid)
+    invalid = set(config.keys()) - {'selected_funcs', 'funcs_params'}
+    if invalid or 'selected_funcs' not in config:
+        raise ValueError('The feature configuration should be a dict with '
+                         'the keys "selected_funcs" and (optionally) '
+                         '"funcs_params". Got: %s.' % sorted(config.keys()))
+    return config['selected_funcs'], config.get('funcs_params')
+
+
+def _get_parser():
+    parser = argparse.ArgumentParser(
+        prog='mne-features',
+        description='Extract features from a set of recordings (FIF or '
+                    'EDF/BDF files), split in fixed-length epochs. The '
+                    'features of each recording are written to a separate '
+                    'file.')
+    parser.add_argument('inputs', nargs='+',
+                        help='Input files (glob patterns are expanded).')
+    features = parser.add_mutually_exclusive_group(required=True)
+    features.add_argument('--funcs', nargs='+',
+                          help='Aliases of the feature functions.')
+    features.add_argument('--config',
+                          help='JSON file with the keys "selected_funcs" '
+                               'and (optionally) "funcs_params".')
+    parser.add_argument('--duration', type=float, default=2.,
+                        help='Duration of the epochs, in seconds '
+                             '(default: 2.).')
+    parser.add_argument('--overlap', type=float, default=0.,
+                        help='Overlap between consecutive epochs, in seconds '
+                             '(default: 0.).')
+    parser.add_argument('--ch-types', nargs='+',
+                        default=['meg', 'eeg', 'seeg', 'ecog'],
+                        help='Types of the channels to use (default: meg eeg '
+                             'seeg ecog).')
+    parser.add_argument('--output-dir', default='.',
+                        help='Directory of the output files (default: .).')
+    parser.add_argument('--format', default='parquet',
+                        choices=sorted(_extensions.keys()),
+                        help='Format of the output files (default: '
+                             'parquet).')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help='Number of epochs written at once '
+                             '(default: 1000).')
+    parser.add_argument('--checkpoint-dir',
+                        help='If given, the features of each chunk of epochs '
+                             'are saved in a sub-directory (one per '
+                             'recording) of this directory as soon as they '
+                             'are extracted. Running the same command again '
+                             'resumes an interrupted extraction.')
+    parser.add_argument('--on-error', default='raise',
+                        choices=['raise', 'nan', 'skip'],
+                        help='Policy applied when a feature function fails '
+                             'on an epoch: abort the extraction of the '
+                             'recording (raise), set the features to NaN '
+                             '(nan) or leave the epoch out (skip, the '
+                             'indices of the remaining epochs are then '
+                             'written to the column "epoch"). The errors '
+                             'are written to <output>_errors.csv '
+                             '(default: raise).')
+    parser.add_argument('--max-memory',
+                        help='Memory budget of the extraction (for instance, '
+                             '4G), shared by the recordings processed in '
+                             'parallel. The size of the chunks of epochs is '
+                             'reduced to fit in the budget.')
+    parser.add_argument('--n-jobs', type=int, default=1,
+                        help='Number of recordings processed in parallel. '
+                             'Negative values are counted from the number '
+                             'of CPUs (-1: all the CPUs, -2: all the CPUs '
+                             'but one...) (default: 1).')
+    return parser
+
+
+def main(argv=None):
+    """ Entry point of the `mne-features` command.
+
+    Parameters
+    ----------
+    argv : list of str or None (default: None)
+        Command line arguments. If None, `sys.argv[1:]` is used.
+
+    Returns
+    -------
+    status : int
+        0 if the features of all the recordings were extracted and 1
+        otherwise.
+    """
+    args = _get_parser().parse_args(argv)
+    if args.config is not None:
+        selected_funcs, funcs_params = _read_config(args.config)
+    else:
+        selected_funcs, funcs_params = args.funcs, None
+    fnames = sorted(set(f for pattern in args.inputs for f in glob(pattern)))
+    if not fnames:
+        print('No input file matches %s.' % ' '.join(args.inputs),
+              file=sys.stderr)
+        return 1
+    if not op.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    output_files = [op.join(args.output_dir,
+                            op.basename(_split_ext(fname)[0]) + '_features' +
+                            _extensions[args.format]) for fname in fnames]
+    if len(set(output_files)) < len(output_files):
+        print('Several input files have the same name: their output files '
+              'would overwrite each other.', file=sys.stderr)
+        return 1
+    if args.checkpoint_dir is not None:
+        checkpoint_dirs = [op.join(args.checkpoint_dir,
+                                   op.basename(_split_ext(fname)[0]))
+                           for fname in fnames]
+    else:
+        checkpoint_dirs = [None] * len(fnames)
+    if args.n_jobs == 0:
+        print('The number of jobs should be nonzero.', file=sys.stderr)
+        return 1
+    n_jobs = args.n_jobs
+    if n_jobs < 0:
+        # As in joblib, -1 means all the CPUs, -2 all the CPUs but one...
+        n_jobs = max(joblib.cpu_count() + 1 + n_jobs, 1)
+    max_memory = None
+    if args.max_memory is not None:
+        try:
+            max_memory = _check_max_memory(args.max_memory) // n_jobs
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+    results = joblib.Parallel(n_jobs=n_jobs)(joblib.delayed(_try_process_file)(
+        fname, output_file, selected_funcs, funcs_params, args.duration,
+        args.overlap, args.ch_types, args.chunk_size, checkpoint_dir,
+        args.on_error, max_memory) for fname, output_file, checkpoint_dir in
+        zip(fnames, output_files, checkpoint_dirs))
+    status = 0
+    for fname, output_file, (output, error) in zip(fnames, output_files,
+                                                   results):
+        if error is not None:
+            status = 1
+            print('%s: failed (%s)' % (fname, error), file=sys.stderr)
+        else:
+            n_epochs, n_errors = output
+            msg = '%s: %d epochs -> %s' % (fname, n_epochs, output_file)
+            if n_errors:
+                msg += ' (%d errors)' % n_errors
+            print(msg)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,16 +3,27 @@
 # License: BSD 3 clause
 
 
+import json
+import os
+import os.path as op
+import zlib
+from functools import partial
 from inspect import getargs
+from warnings import warn
 
 import numpy as np
 import pandas as pd
+from scipy.signal import hilbert
 from sklearn.externals import joblib
 from sklearn.pipeline import FeatureUnion
 from sklearn.preprocessing import FunctionTransformer
+from sklearn.utils import check_array
 
 from .bivariate import get_bivariate_funcs
-from .univariate import get_univariate_funcs
+from .univariate import get_univariate_funcs, _svd_spectrum
+from .utils import (cached_call, embed, epoch_cache, power_spectrum,
+                    _check_psd_params, _get_bands_filter_bank)
+from .writers import FeatureWriter
 
 
 class FeatureFunctionTransformer(FunctionTransformer):
@@ -127,7 +138,459 @@ class FeatureFunctionTransformer(FunctionTransformer):
         return self
 
 
-def _format_as_dataframe(X, feature_names):
+def _psd(sfreq, data):
+    return power_spectrum(sfreq, data)
+
+
+def _analytic_signal(sfreq, data):
+    return hilbert(data, axis=-1)
+
+
+def _derivative(sfreq, data):
+    return np.diff(data, axis=-1)
+
+
+def _embedding(sfreq, data):
+    return embed(data, d=10, tau=2)
+
+
+def _singular_values(sfreq, data):
+    return _svd_spectrum(data, 2, 10)
+
+
+_intermediates = {'psd': _psd, 'analytic_signal': _analytic_signal,
+                  'derivative': _derivative, 'embedding': _embedding,
+                  'singular_values': _singular_values}
+
+_registered_funcs = dict()
+
+
+def register_intermediate(name, func):
+    """ Register an intermediate quantity which can be shared by several
+    (user-defined) feature functions.
+
+    The built-in intermediates are:
+
+    * 'psd': output of `utils.power_spectrum(sfreq, data)`, i.e. the tuple
+      (ps, freqs).
+    * 'analytic_signal': analytic signal of each channel (see
+      `scipy.signal.hilbert`).
+    * 'derivative': first order difference of each channel.
+    * 'embedding': time-delay embedding of each channel (`d=10`, `tau=2`,
+      see `utils.embed`).
+    * 'singular_values': normalized singular values of the embedded channels
+      (`d=10`, `tau=2`, as in `univariate.compute_svd_entropy`).
+
+    Parameters
+    ----------
+    name : str
+        Name of the intermediate quantity.
+
+    func : callable
+        Function with signature `func(sfreq, data)` which returns the
+        intermediate quantity of an epoch `data` of shape
+        (n_channels, n_times). The intermediate is computed once per epoch.
+        If it is an ndarray (or a tuple), the arrays it contains are made
+        read-only; other objects (for instance, floats) are passed as is.
+        The function is sent to the worker processes along with the feature
+        functions which require it, so it should be picklable when
+        `n_jobs > 1` (for instance, defined at the top level of a module).
+    """
+    if name in _intermediates:
+        raise ValueError('An intermediate named %s is already registered.' %
+                         name)
+    _intermediates[name] = func
+
+
+class _RegisteredFeature(object):
+    """ Feature function built from a function registered with
+    `register_feature`: the intermediates required by the function are
+    computed (once per epoch) and passed to the function.
+
+    Parameters
+    ----------
+    alias : str
+
+    func : callable
+        Registered feature function.
+
+    sfreq : float
+        Sampling rate of the data.
+
+    n_outputs : callable or None
+
+    intermediates : tuple of tuple
+        Name and function of each intermediate required by `func`. They are
+        stored in the instance (rather than looked up in the registry when
+        it is called), so that they are available in the worker processes.
+
+    needs_sfreq : bool
+
+    memory : callable or None
+    """
+    def __init__(self, alias, func, sfreq, n_outputs, intermediates,
+                 needs_sfreq, memory):
+        self.alias = alias
+        self.func = func
+        self.sfreq = sfreq
+        self.n_outputs = n_outputs
+        self.intermediates = intermediates
+        self.needs_sfreq = needs_sfreq
+        self.memory = memory
+
+    def __call__(self, data, **params):
+        intermediates = [cached_call(('intermediate', name), data,
+                                     partial(intermediate, self.sfreq, data))
+                         for name, intermediate in self.intermediates]
+        if self.needs_sfreq:
+            out = self.func(self.sfreq, data, *intermediates, **params)
+        else:
+            out = self.func(data, *intermediates, **params)
+        if self.n_outputs is not None:
+            n_outputs = self.n_outputs(data.shape)
+            if out.shape != (n_outputs,):
+                raise ValueError('The feature function registered as %s '
+                                 'should return an array of shape (%d,). '
+                                 'Got %s.' % (self.alias, n_outputs,
+                                              out.shape))
+        return out
+
+
+def register_feature(alias, func, n_outputs=None, requires=None,
+                     needs_sfreq=False, memory=None):
+    """ Register a (user-defined) feature function, which can then be
+    selected by its alias in `extract_features`.
+
+    Parameters
+    ----------
+    alias : str
+        Alias of the feature function. It should differ from the aliases of
+        the feature functions of `mne_features`.
+
+    func : callable
+        Feature function with signature
+        `func(data, *intermediates, **params)` (or
+        `func(sfreq, data, *intermediates, **params)` if `needs_sfreq` is
+        True), where `data` is an array of shape (n_channels, n_times) and
+        `intermediates` are the intermediate quantities listed in
+        `requires` (in the same order). The optional parameters `params`
+        (arguments with default values) can be set using the `funcs_params`
+        parameter of `extract_features`. The function should return an
+        array of shape (n_outputs,).
+
+    n_outputs : callable or None (default: None)
+        If not None, function which returns the number of outputs of `func`
+        given the shape (n_channels, n_times) of the data. The shape of the
+        output of `func` is then checked. With the error policies 'nan' and
+        'skip' of `extract_features`, it also gives the number of features
+        of `func` when it fails on all the epochs.
+
+    requires : list of str or None (default: None)
+        Names of the intermediate quantities consumed by `func` (see
+        `register_intermediate`). Each intermediate is computed only once
+        per epoch and shared by all the feature functions which require it.
+
+    needs_sfreq : bool (default: False)
+        If True, the sampling rate of the data is passed as first argument
+        to `func`.
+
+    memory : callable or None (default: None)
+        If not None, function which returns an estimate of the peak memory
+        (in bytes) used by `func` (and the intermediates it requires) given
+        the shape (n_channels, n_times) of the data. It is used to plan the
+        extraction when `max_memory` is passed to `extract_features`. If
+        None, the peak memory is assumed to be a few times the size of the
+        data.
+    """
+    if alias in get_univariate_funcs(1.) or alias in get_bivariate_funcs(1.):
+        raise ValueError('The alias %s is already used by a feature function '
+                         'of mne_features.' % alias)
+    requires = tuple() if requires is None else tuple(requires)
+    for name in requires:
+        if name not in _intermediates:
+            raise ValueError('Unknown intermediate %s. The registered '
+                             'intermediates are: %s.' %
+                             (name, sorted(_intermediates.keys())))
+    _registered_funcs[alias] = (func, n_outputs, requires, needs_sfreq,
+                                memory)
+
+
+def _get_registered_funcs(sfreq):
+    """ Returns a dictionary of the feature functions registered with
+    `register_feature`.
+
+    Parameters
+    ----------
+    sfreq : float
+        Sampling rate of the data.
+
+    Returns
+    -------
+    registered_funcs : dict of feature functions
+    """
+    registered_funcs = dict()
+    for alias, params in _registered_funcs.items():
+        func, n_outputs, requires, needs_sfreq, memory = params
+        intermediates = tuple((name, _intermediates[name])
+                              for name in requires)
+        registered_funcs[alias] = _RegisteredFeature(
+            alias, func, sfreq, n_outputs, intermediates, needs_sfreq, memory)
+    return registered_funcs
+
+
+def _scaled_memory(factor):
+    """ Utility function which returns an estimator of the peak memory of a
+    feature function whose temporary arrays scale with the size of the data.
+
+    Parameters
+    ----------
+    factor : int
+        Peak memory of the feature function, in number of epoch-sized float64
+        arrays.
+
+    Returns
+    -------
+    callable
+        Function with signature `memory(sfreq, n_channels, n_times, params)`.
+    """
+    def _memory(sfreq, n_channels, n_times, params):
+        return 8 * factor * n_channels * n_times
+    return _memory
+
+
+def _embedding_memory(sfreq, n_channels, n_times, params):
+    # Embedded channels and workspace of the SVD
+    return 3 * 8 * n_channels * n_times * params.get('emb', 10)
+
+
+def _nonlin_interdep_memory(sfreq, n_channels, n_times, params):
+    emb, nn = params.get('emb', 10), params.get('nn', 5)
+    # Embedding, k-d tree and nearest neighbours of each channel, and the
+    # distances between the neighbours of the two channels of a pair
+    return 8 * n_times * ((2 * emb + nn) * n_channels + 2 * nn * emb)
+
+
+def _energy_freq_bands_memory(sfreq, n_channels, n_times, params):
+    freq_bands = params['freq_bands']
+    n_bands = len(freq_bands) - 1
+    n_fft = _get_bands_filter_bank(sfreq, freq_bands, n_times)[3]
+    # Complex spectra of the filtered data of all the frequency bands (and
+    # copy made by the inverse FFT), real output of the inverse FFT (of
+    # length n_fft, which includes the padding and the length of the
+    # filters) and squared filtered data. Padded data, its spectrum and
+    # differentiated data.
+    n_filtered = n_bands * n_channels * (5 * n_fft + n_times)
+    return 8 * (n_filtered + 2 * n_channels * (n_fft + n_times))
+
+
+def _cross_spectra_memory(sfreq, n_channels, n_times, params):
+    psd_params = dict(_check_psd_params('welch', params.get('psd_params')))
+    n_freqs = min(psd_params['n_per_seg'], n_times) // 2 + 1
+    # Fourier coefficients of the (overlapping) segments and cross-spectral
+    # matrices (complex)
+    return 16 * (2 * n_channels * n_times + 3 * n_freqs * n_channels ** 2)
+
+
+def _corr_coefs_memory(sfreq, n_channels, n_times, params):
+    # Standardized (or analytic) signals and matrices of all the pairs of
+    # channels
+    return 8 * (6 * n_channels * n_times + 4 * n_channels ** 2)
+
+
+_default_memory = _scaled_memory(4)
+
+_memory_estimates = {
+    'app_entropy': _scaled_memory(8),
+    'samp_entropy': _scaled_memory(8),
+    'svd_entropy': _embedding_memory,
+    'svd_fisher_info': _embedding_memory,
+    'energy_freq_bands': _energy_freq_bands_memory,
+    'max_cross_corr': _scaled_memory(12),
+    'plv': _corr_coefs_memory,
+    'nonlin_interdep': _nonlin_interdep_memory,
+    'time_corr': _corr_coefs_memory,
+    'spect_corr': _corr_coefs_memory,
+    'coherence': _cross_spectra_memory,
+    'imag_coherence': _cross_spectra_memory,
+    'band_plv': _cross_spectra_memory}
+
+
+# Aliases of the feature functions which accept a batch of epochs, of shape
+# (n_epochs, n_channels, n_times), and then return an array of shape
+# (n_epochs, n_features). They are applied to each chunk of epochs at once
+# (see `_extract_chunk`).
+_batch_funcs = ('pow_freq_bands', 'time_corr', 'spect_corr')
+
+
+def _estimate_func_memory(alias, tr, sfreq, n_channels, n_times):
+    """ Utility function which returns a (rough) estimate of the peak memory
+    used by a feature function to extract the features of one epoch.
+
+    Parameters
+    ----------
+    alias : str
+        Alias of the feature function.
+
+    tr : Instance of FeatureFunctionTransformer
+
+    sfreq : float
+        Sampling rate of the data.
+
+    n_channels : int
+
+    n_times : int
+
+    Returns
+    -------
+    memory : int
+        Estimated peak memory, in bytes.
+    """
+    if isinstance(tr.func, _RegisteredFeature) and \
+            tr.func.memory is not None:
+        return tr.func.memory((n_channels, n_times))
+    estimate = _memory_estimates.get(alias, _default_memory)
+    return estimate(sfreq, n_channels, n_times, tr.get_params())
+
+
+def _estimate_epoch_memory(extractor, sfreq, n_channels, n_times):
+    """ Utility function which returns a (rough and rather conservative)
+    estimate of the peak memory used to extract the features of one epoch.
+
+    The estimate is the sum of the peak memory of the feature functions
+    (intermediates are cached, so that the memory they use is not released
+    between two feature functions) and of two copies of the epoch.
+
+    Parameters
+    ----------
+    extractor : Instance of sklearn.pipeline.FeatureUnion
+
+    sfreq : float
+        Sampling rate of the data.
+
+    n_channels : int
+
+    n_times : int
+
+    Returns
+    -------
+    memory : int
+        Estimated peak memory, in bytes.
+    """
+    memory = 2 * 8 * n_channels * n_times
+    for alias, tr in extractor.transformer_list:
+        memory += _estimate_func_memory(alias, tr, sfreq, n_channels,
+                                        n_times)
+    return int(memory)
+
+
+def _check_max_memory(max_memory):
+    """ Utility function which converts a memory budget to a number of bytes.
+
+    Parameters
+    ----------
+    max_memory : int, float or str
+        Number of bytes, or string such as '500M' or '2G' (see
+        `joblib.disk.memstr_to_bytes`).
+
+    Returns
+    -------
+    max_memory : int
+    """
+    if isinstance(max_memory, str):
+        try:
+            max_memory = joblib.disk.memstr_to_bytes(max_memory)
+        except ValueError:
+            raise ValueError('Invalid memory budget: %s. It should be a '
+                             'number of bytes or a string such as "500M" or '
+                             '"2G".' % max_memory)
+    if not max_memory > 0:
+        raise ValueError('The memory budget `max_memory` should be positive. '
+                         'Got %s.' % max_memory)
+    return int(max_memory)
+
+
+def _plan_memory(max_memory, epoch_memory, n_features, n_epochs, n_jobs,
+                 chunk_size, in_memory, fixed_chunk_size=None,
+                 batch_memory=0):
+    """ Utility function which chooses the number of workers and the size of
+    the chunks of epochs so that the estimated peak memory of the extraction
+    does not exceed `max_memory`.
+
+    Each worker holds an epoch (with its intermediates and temporaries, see
+    `_estimate_epoch_memory`) and each chunk of features is held twice
+    (outputs of the workers and stacked chunk). The feature functions which
+    are applied to a whole chunk at once (see `_batch_funcs`) use
+    `batch_memory` bytes per epoch of the chunk. If the features are returned
+    (`in_memory`), they are also held twice (chunks and output array). The
+    number of workers is chosen first and the size of the chunks is then
+    reduced to fit in the remaining memory. If the size of the chunks is
+    fixed (`fixed_chunk_size`), only the number of workers is chosen.
+
+    Parameters
+    ----------
+    max_memory : int
+        Memory budget, in bytes.
+
+    epoch_memory : int
+        Estimated peak memory of the extraction of one epoch, in bytes.
+
+    n_features : int
+
+    n_epochs : int
+
+    n_jobs : int
+        Requested number of workers (-1 for all the cores).
+
+    chunk_size : int
+        Maximum number of epochs in each chunk.
+
+    in_memory : bool
+        If True, the extracted features are kept in memory and returned.
+
+    fixed_chunk_size : int or None (default: None)
+        If not None, size of the chunks (for instance, the size of the chunks
+        of a resumed extraction).
+
+    batch_memory : int (default: 0)
+        Estimated peak memory of the feature functions applied to a whole
+        chunk, per epoch of the chunk, in bytes.
+
+    Returns
+    -------
+    n_jobs : int
+
+    chunk_size : int
+    """
+    if n_jobs < 0:
+        n_jobs = max(joblib.cpu_count() + 1 + n_jobs, 1)
+    row_memory = 8 * n_features
+    available = max_memory
+    if in_memory:
+        available -= 2 * n_epochs * row_memory
+    # Memory used by each epoch of a chunk
+    chunk_row_memory = 2 * row_memory + batch_memory
+    if fixed_chunk_size is not None:
+        n_jobs_max = int((available - fixed_chunk_size * chunk_row_memory) //
+                         epoch_memory)
+        return max(min(n_jobs, n_jobs_max), 1), fixed_chunk_size
+    n_jobs_max = int(available // (epoch_memory + chunk_row_memory))
+    if n_jobs_max < 1:
+        output = ''
+        if in_memory:
+            output = ' and of the extracted features (%d bytes)' % (
+                max_memory - available)
+        warn('The memory budget `max_memory` (%d bytes) is smaller than the '
+             'estimated memory of the extraction of one epoch (%d bytes)%s. '
+             'The epochs are processed one at a time.' %
+             (max_memory, epoch_memory, output))
+        return 1, 1
+    n_jobs = min(n_jobs, n_jobs_max)
+    max_chunk_size = (available - n_jobs * epoch_memory) // chunk_row_memory
+    chunk_size = min(chunk_size, int(max_chunk_size))
+    return n_jobs, max(chunk_size, n_jobs)
+
+
+def _format_as_dataframe(X, feature_names, index=None):
     """ Utility function to format extracted features (X) as a Pandas
     DataFrame using names and indexes from `feature_names`. The index of the
     columns is a MultiIndex with two levels. At level 0, the alias of the
@@ -141,6 +604,9 @@ def _format_as_dataframe(X, feature_names):
 
     feature_names : list of str
 
+    index : array-like or None (default: None)
+        If not None, index of the rows (epochs) of the DataFrame.
+
     Returns
     -------
     output : Pandas DataFrame
@@ -150,13 +616,12 @@ def _format_as_dataframe(X, feature_names):
         raise ValueError('The length of `feature_names` should be equal to '
                          '`X.shape[1]` (`n_features`).')
     else:
-        _names = [n.split('__')[0] for n in feature_names]
-        _idx = [n.split('__')[1] for n in feature_names]
-        columns = pd.MultiIndex.from_arrays([_names, _idx])
-        return pd.DataFrame(data=X, columns=columns)
+        columns = pd.MultiIndex.from_tuples(
+            [tuple(n.split('__', 1)) for n in feature_names])
+        return pd.DataFrame(data=X, columns=columns, index=index)
 
 
-def _apply_extractor(extractor, X):
+def _apply_extractor(extractor, X, on_error='raise', widths=None):
     """ Utility function to apply features extractor to ndarray X.
 
     Parameters
@@ -165,11 +630,373 @@ def _apply_extractor(extractor, X):
 
     X : ndarray, shape (n_channels, n_times)
 
+    on_error : str (default: 'raise')
+        Error policy (see `extract_features`). If 'nan' or 'skip', the
+        feature functions are applied one by one and their errors are
+        caught.
+
+    widths : list of int or None (default: None)
+        Number of outputs of each feature function (only used if `on_error`
+        is 'nan').
+
     Returns
     -------
     ndarray, shape (n_features,)
+        If `on_error` is 'nan' or 'skip', a tuple (features, errors) is
+        returned instead. In this case, `errors` is a list of tuples
+        (alias, error) and `features` is None if the epoch is skipped.
+
+    Notes
+    -----
+    The intermediate quantities shared by the feature functions are cached
+    while the features of X are extracted (see `utils.epoch_cache`).
+    """
+    with epoch_cache():
+        if on_error == 'raise':
+            return extractor.fit_transform(X)
+        outputs, errors = list(), list()
+        for (alias, tr), width in zip(extractor.transformer_list, widths):
+            try:
+                outputs.append(tr.fit_transform(X))
+            except Exception as e:
+                errors.append((alias, '%s: %s' % (type(e).__name__, e)))
+                if on_error == 'skip':
+                    return None, errors
+                outputs.append(np.full((width,), np.nan))
+        return np.hstack(outputs), errors
+
+
+def _get_widths(extractor, X):
+    """ Utility function which returns the number of outputs of each feature
+    function of the extractor. Each feature function is applied to the
+    epochs of X until it does not fail (usually, on the first epoch).
+
+    If a feature function fails on all the epochs, a warning is emitted (its
+    features are then set to NaN, or all the epochs are skipped, depending on
+    the error policy). Its number of outputs is then given by `n_outputs`, if
+    it was declared when the function was registered (see
+    `register_feature`), and is otherwise obtained by applying the function
+    to random data of the same shape as the epochs.
+
+    Parameters
+    ----------
+    extractor : Instance of sklearn.pipeline.FeatureUnion
+
+    X : ndarray, shape (n_epochs, n_channels, n_times)
+
+    Returns
+    -------
+    widths : list of int
     """
-    return extractor.fit_transform(X)
+    widths = [None] * len(extractor.transformer_list)
+    for j in range(X.shape[0]):
+        with epoch_cache():
+            for k, (_, tr) in enumerate(extractor.transformer_list):
+                if widths[k] is None:
+                    try:
+                        widths[k] = tr.fit_transform(X[j, :, :]).shape[0]
+                    except Exception:
+                        pass
+        if all(width is not None for width in widths):
+            return widths
+    failed = [alias for (alias, _), width in
+              zip(extractor.transformer_list, widths) if width is None]
+    _X = np.random.RandomState(0).standard_normal(X.shape[1:])
+    unknown = list()
+    with epoch_cache():
+        for k, (alias, tr) in enumerate(extractor.transformer_list):
+            if widths[k] is not None:
+                continue
+            if isinstance(tr.func, _RegisteredFeature) and \
+                    tr.func.n_outputs is not None:
+                widths[k] = tr.func.n_outputs(X.shape[1:])
+            else:
+                try:
+                    widths[k] = tr.fit_transform(_X).shape[0]
+                except Exception:
+                    unknown.append(alias)
+                    continue
+            # Names of the features
+            tr.output_shape_ = widths[k]
+    if unknown:
+        raise ValueError('The feature functions %s failed on all the epochs '
+                         'and their number of outputs is unknown. It can be '
+                         'declared with the parameter `n_outputs` of '
+                         '`register_feature`.' % unknown)
+    warn('The feature functions %s failed on all the epochs.' % failed)
+    return widths
+
+
+def _apply_batch(tr, X, width):
+    """ Utility function which applies the feature function of a transformer
+    to a batch of epochs at once.
+
+    Parameters
+    ----------
+    tr : Instance of FeatureFunctionTransformer
+
+    X : ndarray, shape (n_epochs, n_channels, n_times)
+
+    width : int
+        Number of outputs of the feature function (per epoch).
+
+    Returns
+    -------
+    output : ndarray, shape (n_epochs, width)
+    """
+    if tr.validate:
+        X = check_array(X, allow_nd=True)
+    kw_args = tr.kw_args if tr.kw_args is not None else dict()
+    X_out = tr.func(X, **kw_args)
+    if X_out.shape != (X.shape[0], width):
+        raise ValueError('The output of the feature function should be of '
+                         'shape %s. Got %s.' % ((X.shape[0], width),
+                                                X_out.shape))
+    return X_out
+
+
+def _extract_chunk(extractor, X, epochs, n_jobs, on_error, widths):
+    """ Utility function which extracts the features of the given epochs.
+
+    The feature functions which accept a batch of epochs (see `_batch_funcs`)
+    are applied to the whole chunk at once (in the main process, the
+    intermediates they share being cached for the chunk). The other feature
+    functions (and the batch feature functions which fail on the chunk, so
+    that their errors are attributed to the epochs) are applied epoch by
+    epoch, by `n_jobs` workers.
+
+    Parameters
+    ----------
+    extractor : Instance of sklearn.pipeline.FeatureUnion
+
+    X : ndarray, shape (n_epochs, n_channels, n_times)
+
+    epochs : range
+        Indices of the (consecutive) epochs of the chunk.
+
+    n_jobs : int
+
+    on_error : str
+
+    widths : list of int or None
+        Number of outputs of each feature function. If None (only if
+        `on_error` is 'raise'), all the feature functions are applied epoch
+        by epoch.
+
+    Returns
+    -------
+    chunk : ndarray, shape (n_epochs_chunk, n_features)
+
+    kept_epochs : ndarray, shape (n_epochs_chunk,)
+        Indices of the epochs of `chunk` (the skipped epochs are not kept).
+
+    errors : list of tuple
+        List of (epoch, alias, error).
+    """
+    epochs = np.asarray(epochs)
+    if widths is None:
+        res = joblib.Parallel(n_jobs=n_jobs)(joblib.delayed(_apply_extractor)(
+            extractor, X[j, :, :]) for j in epochs)
+        return np.vstack(res), epochs, list()
+    offsets = np.cumsum([0] + list(widths))
+    chunk = np.empty((epochs.size, offsets[-1]))
+    per_epoch = list()
+    with epoch_cache():
+        _X = X[epochs[0]:(epochs[-1] + 1)]
+        for k, (alias, tr) in enumerate(extractor.transformer_list):
+            if alias in _batch_funcs:
+                try:
+                    chunk[:, offsets[k]:offsets[k + 1]] = _apply_batch(
+                        tr, _X, widths[k])
+                    continue
+                except Exception:
+                    pass
+            per_epoch.append(k)
+    kept = np.ones(epochs.size, dtype=bool)
+    errors = list()
+    if per_epoch:
+        if len(per_epoch) < len(extractor.transformer_list):
+            _extractor = FeatureUnion([extractor.transformer_list[k]
+                                       for k in per_epoch])
+        else:
+            _extractor = extractor
+        res = joblib.Parallel(n_jobs=n_jobs)(joblib.delayed(_apply_extractor)(
+            _extractor, X[j, :, :], on_error, [widths[k] for k in per_epoch])
+            for j in epochs)
+        if on_error == 'raise':
+            res = [(row, list()) for row in res]
+        cols = np.concatenate([np.arange(offsets[k], offsets[k + 1])
+                               for k in per_epoch])
+        for i, (j, (row, _errors)) in enumerate(zip(epochs, res)):
+            errors.extend((j, alias, error) for alias, error in _errors)
+            if row is None:
+                kept[i] = False
+            else:
+                chunk[i, cols] = row
+    return chunk[kept], epochs[kept], errors
+
+
+def _save_atomic(fname, write):
+    """ Utility function which writes a file atomically: the file is first
+    written (and flushed to disk) under a temporary name and then renamed.
+    Hence, an interrupted write never leaves a truncated file.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the file.
+
+    write : callable
+        Function with signature `write(fid)`, where `fid` is a binary file
+        object.
+    """
+    tmp_fname = fname + '.tmp'
+    with open(tmp_fname, 'wb') as fid:
+        write(fid)
+        fid.flush()
+        os.fsync(fid.fileno())
+    # `os.replace` is not available in Python 2 (where `os.rename` replaces
+    # the file on POSIX systems)
+    getattr(os, 'replace', os.rename)(tmp_fname, fname)
+
+
+def _data_crc32(X):
+    """ Utility function which returns the CRC32 checksum of the data,
+    computed epoch by epoch (so that the data is not copied at once).
+
+    Parameters
+    ----------
+    X : ndarray, shape (n_epochs, n_channels, n_times)
+
+    Returns
+    -------
+    crc : int
+    """
+    crc = 0
+    for x in X:
+        crc = zlib.crc32(np.ascontiguousarray(x).tobytes(), crc)
+    return crc & 0xffffffff
+
+
+def _check_checkpoint_dir(checkpoint_dir, manifest):
+    """ Utility function which checks that the checkpoints saved in
+    `checkpoint_dir` (if any) belong to the extraction described by
+    `manifest`.
+
+    The size of the chunks planned from a memory budget depends on the number
+    of cores of the machine. Hence, the manifest holds the requested size of
+    the chunks and memory budget (compared with the saved manifest) and the
+    planned size of the chunks ('planned_chunk_size', which is not compared).
+    When an extraction is resumed, the chunks should be the same as those of
+    the interrupted extraction: the planned size of the chunks of the saved
+    manifest is returned.
+
+    Parameters
+    ----------
+    checkpoint_dir : str
+
+    manifest : dict
+        Description of the extraction (data, feature functions, parameters,
+        size of the chunks and memory budget).
+
+    Returns
+    -------
+    planned_chunk_size : int or None
+        Planned size of the chunks of the saved manifest (None if the
+        directory contains no checkpoint).
+    """
+    fname = op.join(checkpoint_dir, 'checkpoint.json')
+    if not op.isfile(fname):
+        return None
+    with open(fname, 'r') as fid:
+        saved_manifest = json.load(fid)
+    planned_chunk_size = saved_manifest.pop('planned_chunk_size', None)
+    if saved_manifest != manifest or planned_chunk_size is None:
+        raise ValueError('The directory %s contains the checkpoints of a '
+                         'different extraction (other data, feature '
+                         'functions, parameters, chunk size or memory '
+                         'budget). Use another directory.' % checkpoint_dir)
+    return planned_chunk_size
+
+
+def _save_checkpoint_manifest(checkpoint_dir, manifest, planned_chunk_size):
+    """ Utility function which saves the manifest of an extraction (see
+    `_check_checkpoint_dir`) in `checkpoint_dir`.
+
+    Parameters
+    ----------
+    checkpoint_dir : str
+
+    manifest : dict
+
+    planned_chunk_size : int
+    """
+    if not op.isdir(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+    manifest = dict(manifest, planned_chunk_size=planned_chunk_size)
+    _save_atomic(op.join(checkpoint_dir, 'checkpoint.json'),
+                 lambda fid: fid.write(json.dumps(manifest).encode()))
+
+
+def _iter_chunks(extractor, X, n_jobs, chunk_size, checkpoint_dir, on_error,
+                 widths):
+    """ Utility function which extracts the features of the epochs of X,
+    chunk by chunk.
+
+    If `checkpoint_dir` is not None, the features of each chunk are saved in
+    `checkpoint_dir` as soon as they are extracted and the chunks which were
+    already saved (by a previous, interrupted, run) are loaded instead of
+    being extracted again.
+
+    Parameters
+    ----------
+    extractor : Instance of sklearn.pipeline.FeatureUnion
+
+    X : ndarray, shape (n_epochs, n_channels, n_times)
+
+    n_jobs : int
+
+    chunk_size : int
+
+    checkpoint_dir : str or None
+
+    on_error : str
+
+    widths : list of int or None
+
+    Returns
+    -------
+    generator of tuple
+        Outputs of `_extract_chunk` for each chunk.
+    """
+    n_epochs = X.shape[0]
+    for start in range(0, n_epochs, chunk_size):
+        epochs = range(start, min(start + chunk_size, n_epochs))
+        fname = None
+        if checkpoint_dir is not None:
+            fname = op.join(checkpoint_dir, 'chunk_%09d' % start)
+            if op.isfile(fname + '.npy'):
+                chunk = np.load(fname + '.npy', mmap_mode='r')
+                kept_epochs, errors = np.asarray(epochs), list()
+                if op.isfile(fname + '.json'):
+                    with open(fname + '.json', 'r') as fid:
+                        log = json.load(fid)
+                    kept_epochs = np.array(log['epochs'], dtype=int)
+                    errors = [tuple(error) for error in log['errors']]
+                yield chunk, kept_epochs, errors
+                continue
+        chunk, kept_epochs, errors = _extract_chunk(extractor, X, epochs,
+                                                    n_jobs, on_error, widths)
+        if fname is not None:
+            if errors:
+                # The log of the chunk is saved before the chunk itself
+                log = {'epochs': kept_epochs.tolist(),
+                       'errors': [[int(j), alias, error]
+                                  for j, alias, error in errors]}
+                _save_atomic(fname + '.json',
+                             lambda fid: fid.write(json.dumps(log).encode()))
+            _save_atomic(fname + '.npy', lambda fid: np.save(fid, chunk))
+        yield chunk, kept_epochs, errors
 
 
 def _check_func_names(selected, feature_funcs_names):
@@ -203,7 +1030,9 @@ def _check_func_names(selected, feature_funcs_names):
 
 
 def extract_features(X, sfreq, selected_funcs, funcs_params=None, n_jobs=1,
-                     return_as_df=False):
+                     return_as_df=False, output_file=None, chunk_size=1000,
+                     checkpoint_dir=None, on_error='raise', error_log=None,
+                     max_memory=None):
     """ Extraction of temporal or spectral features from epoched EEG signals.
 
     Parameters
@@ -218,7 +1047,8 @@ def extract_features(X, sfreq, selected_funcs, funcs_params=None, n_jobs=1,
         The elements of `selected_features` are aliases for the feature
         functions which will be used to extract features from the data.
         (See `mne_features` documentation for a complete list of available
-        feature functions).
+        feature functions). The aliases of the feature functions registered
+        with `register_feature` can also be used.
 
     funcs_params : dict or None (default: None)
         If not None, dict of optional parameters to be passed to the feature
@@ -236,9 +1066,67 @@ def extract_features(X, sfreq, selected_funcs, funcs_params=None, n_jobs=1,
         the alias of each feature function which was used. If False, the
         features are returned as a 2d Numpy array.
 
+    output_file : str or None (default: None)
+        If not None, path to a Parquet ('.parquet', '.pq'), Arrow IPC
+        ('.arrow', '.feather', '.ipc') or HDF5 ('.h5', '.hdf5', '.hdf') file.
+        The features are then written to the file, chunk by chunk, as they
+        are extracted (see `writers.FeatureWriter`), instead of being
+        returned. The columns of the file are named as the columns of the
+        DataFrame returned if `return_as_df` is True (with the two levels
+        joined by '__'). If the extraction fails, no file is written.
+
+    chunk_size : int (default: 1000)
+        Number of epochs in each chunk written to `output_file` (or saved in
+        `checkpoint_dir`). Only used if `output_file`, `checkpoint_dir` or
+        `max_memory` is not None. If `max_memory` is not None, it is an
+        upper bound on the size of the chunks.
+
+    checkpoint_dir : str or None (default: None)
+        If not None, directory where the features of each chunk of
+        `chunk_size` epochs are saved (as a .npy file) as soon as they are
+        extracted. If the extraction is interrupted, calling
+        `extract_features` again with the same arguments resumes it: the
+        chunks which were already saved are loaded instead of being extracted
+        again (with the size of the chunks of the interrupted extraction,
+        even if it was planned from `max_memory` on a machine with another
+        number of cores). A ValueError is raised if the directory contains
+        the checkpoints of a different extraction. The checkpoints are not
+        deleted once the extraction is over.
+
+    on_error : str (default: 'raise')
+        Policy applied when a feature function raises an error on an epoch.
+        If 'raise', the error is raised (and the extraction is aborted). If
+        'nan', the features computed by this function on this epoch are set
+        to NaN. If 'skip', the epoch is left out of the output. The indices
+        of the remaining epochs are then given by the index of the DataFrame
+        (if `return_as_df` is True) or written to `output_file` as an int64
+        column (or dataset) named 'epoch'. With 'nan' or 'skip', the other
+        epochs and feature functions are not affected and a warning is
+        emitted at the end of the extraction.
+
+    error_log : list or None (default: None)
+        If not None (and `on_error` is 'nan' or 'skip'), the errors are
+        appended to this list, as tuples (epoch, alias, error) where `epoch`
+        is the index of the epoch, `alias` the alias of the feature function
+        and `error` a description of the error (str).
+
+    max_memory : int, str or None (default: None)
+        If not None, memory budget of the extraction, in bytes or as a
+        string such as '500M' or '2G'. The peak memory of the extraction of
+        one epoch is then estimated from the selected feature functions (and
+        their parameters) and the shape of the data. The number of workers
+        (at most `n_jobs`) and the size of the chunks of epochs (at most
+        `chunk_size`) are chosen so that the estimated peak memory does not
+        exceed the budget. The data `X` itself and the memory used by the
+        worker processes (interpreter and imported modules) are not
+        included. If the extraction of a single epoch does not fit in the
+        budget, a warning is emitted and the epochs are processed one at a
+        time.
+
     Returns
     -------
     array-like, shape (n_epochs, n_features)
+        If `output_file` is not None, None is returned.
     """
     if sfreq <= 0:
         raise ValueError('Sampling rate `sfreq` must be positive.')
@@ -246,6 +1134,7 @@ def extract_features(X, sfreq, selected_funcs, funcs_params=None, n_jobs=1,
     bivariate_funcs = get_bivariate_funcs(sfreq)
     feature_funcs = univariate_funcs.copy()
     feature_funcs.update(bivariate_funcs)
+    feature_funcs.update(_get_registered_funcs(sfreq))
     sel_funcs = _check_func_names(selected_funcs, feature_funcs.keys())
 
     # Feature extraction
@@ -255,10 +1144,81 @@ def extract_features(X, sfreq, selected_funcs, funcs_params=None, n_jobs=1,
     extractor = FeatureUnion(transformer_list=_tr)
     if funcs_params is not None:
         extractor.set_params(**funcs_params)
-    res = joblib.Parallel(n_jobs=n_jobs)(joblib.delayed(_apply_extractor)(
-        extractor, X[j, :, :]) for j in range(n_epochs))
-    Xnew = np.vstack(res)
+    if on_error not in ('raise', 'nan', 'skip'):
+        raise ValueError('The error policy `on_error` should be either '
+                         '"raise", "nan" or "skip". Got %s.' % on_error)
+    chunked = any(param is not None for param in
+                  (output_file, checkpoint_dir, max_memory))
+    widths = None
+    if on_error != 'raise':
+        # The number of outputs (and names of the features) of each feature
+        # function are obtained from the first epoch on which it does not fail
+        widths = _get_widths(extractor, X)
+    elif chunked or any(alias in _batch_funcs for alias in sel_funcs):
+        # The number of outputs (and names of the features) of each feature
+        # function are obtained from the first epoch
+        _apply_extractor(extractor, X[0, :, :])
+        widths = [len(tr.get_feature_names())
+                  for _, tr in extractor.transformer_list]
+    if max_memory is not None:
+        max_memory = _check_max_memory(max_memory)
+    planned_chunk_size = None
+    if checkpoint_dir is not None:
+        manifest = {
+            'shape': list(X.shape), 'sfreq': float(sfreq),
+            'dtype': str(X.dtype), 'data_crc32': _data_crc32(X),
+            'selected_funcs': list(sel_funcs),
+            'funcs_params': (repr(sorted(funcs_params.items()))
+                             if funcs_params is not None else None),
+            'chunk_size': chunk_size, 'max_memory': max_memory,
+            'on_error': on_error}
+        planned_chunk_size = _check_checkpoint_dir(checkpoint_dir, manifest)
+    if max_memory is not None:
+        epoch_memory = _estimate_epoch_memory(extractor, sfreq,
+                                              *X.shape[1:])
+        batch_memory = sum(_estimate_func_memory(alias, tr, sfreq,
+                                                 *X.shape[1:])
+                           for alias, tr in extractor.transformer_list
+                           if alias in _batch_funcs)
+        n_jobs, chunk_size = _plan_memory(
+            max_memory, epoch_memory, len(extractor.get_feature_names()),
+            n_epochs, n_jobs, chunk_size, output_file is None,
+            planned_chunk_size, batch_memory)
+    if checkpoint_dir is not None and planned_chunk_size is None:
+        _save_checkpoint_manifest(checkpoint_dir, manifest, chunk_size)
+    if not chunked:
+        chunks = [_extract_chunk(extractor, X, range(n_epochs), n_jobs,
+                                 on_error, widths)]
+    else:
+        chunks = _iter_chunks(extractor, X, n_jobs, chunk_size,
+                              checkpoint_dir, on_error, widths)
+    errors = list()
+    Xnew = None
+    if output_file is not None:
+        # With the policy 'skip', the indices of the epochs are written along
+        # with the features (as in the index of the DataFrame)
+        index_name = 'epoch' if on_error == 'skip' else None
+        with FeatureWriter(output_file, extractor.get_feature_names(),
+                           index_name) as writer:
+            for chunk, _epochs, _errors in chunks:
+                if chunk.shape[0] > 0:
+                    writer.write(chunk, _epochs if index_name else None)
+                errors.extend(_errors)
+    else:
+        chunks = list(chunks)
+        Xnew = np.vstack([chunk for chunk, _, _ in chunks])
+        epochs = np.concatenate([_epochs for _, _epochs, _ in chunks])
+        errors = [error for _, _, _errors in chunks for error in _errors]
+    if errors:
+        if error_log is not None:
+            error_log.extend(errors)
+        warn('%d error(s) occurred during the feature extraction (policy: '
+             '%s). First error: epoch %s, %s (%s).' %
+             ((len(errors), on_error) + tuple(errors[0])))
+    if Xnew is None:
+        return None
     if return_as_df:
-        return _format_as_dataframe(Xnew, extractor.get_feature_names())
+        return _format_as_dataframe(Xnew, extractor.get_feature_names(),
+                                    epochs if on_error == 'skip' else None)
     else:
         return Xnew
@@ -4,8 +4,10 @@ from warnings import warn
 
 try:
     import numba as nb
+    has_numba = True
 except ImportError as _:
     warn('Numba not found. Your code will be slower.')
+    has_numba = False
 
     class Bunch(dict):
         """Dictionnary-like object that exposes its keys as attributes."""
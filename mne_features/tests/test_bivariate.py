@@ -3,14 +3,22 @@
 # License: BSD 3 clause
 
 
-import numpy as np
-from numpy.testing import assert_equal
+from functools import partial
 
-from mne_features.bivariate import (compute_max_cross_correlation,
+import numpy as np
+from numpy.testing import (assert_almost_equal, assert_equal, assert_raises,
+                           assert_warns)
+from scipy import signal
+from sklearn.preprocessing import scale
+
+from mne_features.bivariate import (compute_band_plv, compute_coherence,
+                                    compute_imag_coherence,
+                                    compute_max_cross_correlation,
                                     compute_nonlinear_interdep,
                                     compute_phase_locking_value,
                                     compute_spect_corr_coefs,
                                     compute_time_corr_coefs)
+from mne_features.utils import pairs_idx
 
 rng = np.random.RandomState(42)
 sfreq = 64.
@@ -24,18 +32,45 @@ def test_shape_output_max_cross_corr():
     assert_equal(feat.shape, (n_coefs,))
 
 
+def test_max_cross_corr():
+    # The first channel is a delayed copy of the second one
+    x = rng.standard_normal((int(sfreq) + 5,))
+    feat = compute_max_cross_correlation(sfreq, np.vstack((x[:-5], x[5:])))
+    assert_almost_equal(feat[1], 1., decimal=1)
+    assert_equal(feat[1] > 0.9, True)
+
+
 def test_shape_output_nonlinear_interdep():
     feat = compute_nonlinear_interdep(data[0, :, :])
     n_coefs = (n_channels * (n_channels + 1)) // 2
     assert_equal(feat.shape, (n_coefs,))
 
 
+def test_nonlinear_interdep():
+    # The interdependence of a channel with itself (or with a copy of
+    # itself) is equal to 2
+    x = data[0, :2, :]
+    feat = compute_nonlinear_interdep(np.vstack((x, x[0])))
+    assert_almost_equal(feat[[0, 2, 3, 5]], 2 * np.ones((4,)))
+    assert_equal(np.all(feat[[1, 4]] < 2), True)
+
+
 def test_shape_output_plv():
     feat = compute_phase_locking_value(data[0, :, :])
     n_coefs = (n_channels * (n_channels + 1)) // 2
     assert_equal(feat.shape, (n_coefs,))
 
 
+def test_plv():
+    x = data[0, :, :]
+    feat = compute_phase_locking_value(x)
+    phase = np.angle(signal.hilbert(x, axis=-1))
+    expected = [np.abs(np.mean(np.exp(1j * (phase[i] - phase[j]))))
+                for i, j in zip(*np.triu_indices(n_channels))]
+    assert_almost_equal(feat, expected)
+    assert_almost_equal(feat[[0, 5, 9, 12, 14]], np.ones((n_channels,)))
+
+
 def test_shape_output_spect_corr():
     feat_eig = compute_spect_corr_coefs(sfreq, data[0, :, :],
                                         with_eigenvalues=True)
@@ -54,10 +89,96 @@ def test_shape_output_time_corr():
     assert_equal(feat.shape, (n_coefs,))
 
 
+def test_time_corr():
+    x = data[0, :, :]
+    corr = np.corrcoef(scale(x, axis=0))
+    w = np.sort(np.abs(np.linalg.eig(corr)[0]))
+    feat = compute_time_corr_coefs(x)
+    assert_almost_equal(feat, np.r_[corr[np.triu_indices(n_channels)], w])
+    feat_batch = compute_time_corr_coefs(data)
+    assert_equal(feat_batch.shape, (n_epochs, feat.shape[0]))
+    for j in range(n_epochs):
+        assert_almost_equal(feat_batch[j], compute_time_corr_coefs(data[j]))
+        assert_almost_equal(
+            compute_spect_corr_coefs(sfreq, data, db=False)[j],
+            compute_spect_corr_coefs(sfreq, data[j], db=False))
+
+
+def test_pairs():
+    x = data[0, :, :]
+    pairs = [(0, 1), (3, 3), (1, 4), (0, 2)]
+    adjacency = np.zeros((n_channels, n_channels), dtype=bool)
+    adjacency[[0, 1, 3], [1, 4, 3]] = True
+    triu = np.zeros((n_channels, n_channels), dtype=int)
+    triu[np.triu_indices(n_channels)] = np.arange(n_channels *
+                                                  (n_channels + 1) // 2)
+    triu = triu + np.triu(triu, 1).T
+    # Position of each pair in the output computed for all the pairs
+    pos = [triu[i, j] for i, j in pairs]
+    pos_adj = [triu[i, j] for i, j in
+               zip(*pairs_idx(n_channels, adjacency))]
+    funcs = [partial(compute_max_cross_correlation, sfreq),
+             compute_phase_locking_value, compute_nonlinear_interdep,
+             partial(compute_time_corr_coefs, with_eigenvalues=False),
+             partial(compute_spect_corr_coefs, sfreq,
+                     with_eigenvalues=False)]
+    for func in funcs:
+        feat = func(x)
+        assert_almost_equal(func(x, pairs=pairs), feat[pos])
+        assert_almost_equal(func(x, pairs=adjacency), feat[pos_adj])
+    feat = compute_time_corr_coefs(x, pairs=pairs)
+    assert_almost_equal(feat, np.r_[compute_time_corr_coefs(x)[pos],
+                                    feat[-n_channels:]])
+    assert_raises(ValueError, compute_phase_locking_value, x,
+                  pairs=[(0, n_channels)])
+    assert_raises(ValueError, compute_phase_locking_value, x,
+                  pairs=np.ones((2, 2), dtype=bool))
+
+
+def test_coherence():
+    x = rng.standard_normal((3, 1024))
+    x[1] += np.roll(x[0], 3)
+    freq_bands = np.array([0.5, 4., 8., 13., 30., 100.])
+    psd_params = {'n_per_seg': 64}
+    feat = compute_coherence(sfreq, x, freq_bands, psd_params)
+    n_coefs = 6
+    assert_equal(feat.shape, (n_coefs * 5,))
+    freqs, coh = signal.coherence(x[0], x[1], sfreq, nperseg=64)
+    idx = np.digitize(freqs, freq_bands)
+    expected = [np.mean(np.sqrt(coh[idx == k])) for k in range(1, 6)]
+    assert_almost_equal(feat.reshape(n_coefs, 5)[1], expected)
+    feat_imag = compute_imag_coherence(sfreq, x, freq_bands, psd_params)
+    assert_equal(np.all(np.abs(feat_imag) <= feat), True)
+    assert_almost_equal(feat_imag.reshape(n_coefs, 5)[[0, 3, 5]],
+                        np.zeros((3, 5)))
+    feat_plv = compute_band_plv(sfreq, x, freq_bands, psd_params,
+                                pairs=[(0, 0), (0, 1)])
+    assert_almost_equal(feat_plv[:5], np.ones((5,)))
+    assert_equal(np.all(feat_plv[5:] < 1), True)
+    assert_almost_equal(compute_coherence(sfreq, x, freq_bands, psd_params,
+                                          pairs=[(0, 1)]),
+                        feat.reshape(n_coefs, 5)[1])
+    # With segments of 4 samples (frequency resolution: 16 Hz), the bands
+    # [0.5, 4], [4, 8] and [8, 13] Hz contain no frequency bin
+    empty_band = np.tile(np.arange(5) < 3, n_coefs)
+    for func in (compute_coherence, compute_imag_coherence,
+                 compute_band_plv):
+        with assert_warns(UserWarning):
+            feat = func(sfreq, x, freq_bands, {'n_per_seg': 4})
+        assert_equal(np.all(np.isnan(feat[empty_band])), True)
+        assert_equal(np.all(np.isfinite(feat[~empty_band])), True)
+
+
 if __name__ == '__main__':
 
     test_shape_output_max_cross_corr()
+    test_max_cross_corr()
     test_shape_output_nonlinear_interdep()
+    test_nonlinear_interdep()
     test_shape_output_plv()
+    test_plv()
     test_shape_output_spect_corr()
     test_shape_output_time_corr()
+    test_time_corr()
+    test_pairs()
+    test_coherence()
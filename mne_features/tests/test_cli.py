@@ -0,0 +1,92 @@
+# Author: Jean-Baptiste Schiratti <jean.baptiste.schiratti@gmail.com>
+#         Alexandre Gramfort <alexandre.gramfort@inria.fr>
+# License: BSD 3 clause
+
+
+import json
+import os.path as op
+from tempfile import mkdtemp
+from unittest import SkipTest
+
+import mne
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+from mne_features.cli import main
+from mne_features.feature_extraction import extract_features
+
+rng = np.random.RandomState(42)
+sfreq = 128.
+n_channels = 4
+
+
+def _make_recordings(tempdir, n_recordings=2):
+    info = mne.create_info(['EEG%s' % j for j in range(n_channels)] +
+                           ['STI'], sfreq, ['eeg'] * n_channels + ['stim'])
+    data = list()
+    for k in range(n_recordings):
+        x = rng.standard_normal((n_channels + 1, int(10 * sfreq))) * 1e-5
+        raw = mne.io.RawArray(x, info, verbose=False)
+        raw.save(op.join(tempdir, 'rec%s_raw.fif' % k), verbose=False)
+        data.append(x[:n_channels])
+    return data
+
+
+def test_cli():
+    try:
+        import h5py
+    except ImportError:
+        raise SkipTest('h5py is not installed.')
+    tempdir = mkdtemp()
+    data = _make_recordings(tempdir)
+    config = op.join(tempdir, 'config.json')
+    with open(config, 'w') as fid:
+        json.dump({'selected_funcs': ['mean', 'pow_freq_bands'],
+                   'funcs_params': {'pow_freq_bands__normalize': False}},
+                  fid)
+    output_dir = op.join(tempdir, 'features')
+    status = main([op.join(tempdir, '*_raw.fif'), '--config', config,
+                   '--duration', '2.', '--overlap', '1.', '--format',
+                   'hdf5', '--output-dir', output_dir, '--n-jobs', '2'])
+    assert_equal(status, 0)
+    for k, x in enumerate(data):
+        # Epochs of 2 s, with an overlap of 1 s
+        epochs = np.array([x[:, j:(j + int(2 * sfreq))]
+                           for j in range(0, x.shape[1] - int(2 * sfreq) + 1,
+                                          int(sfreq))])
+        expected = extract_features(epochs, sfreq, ['mean', 'pow_freq_bands'],
+                                    {'pow_freq_bands__normalize': False})
+        fname = op.join(output_dir, 'rec%s_raw_features.h5' % k)
+        with h5py.File(fname, 'r') as f:
+            assert_almost_equal(f['features'][:], expected)
+    # Resumable extraction
+    checkpoint_dir = op.join(tempdir, 'checkpoints')
+    for _ in range(2):
+        assert_equal(main([op.join(tempdir, 'rec0_raw.fif'), '--funcs',
+                           'mean', '--format', 'hdf5', '--output-dir',
+                           output_dir, '--checkpoint-dir', checkpoint_dir]),
+                     0)
+    assert_equal(op.isfile(op.join(checkpoint_dir, 'rec0_raw',
+                                   'checkpoint.json')), True)
+    # Memory budget
+    assert_equal(main([op.join(tempdir, 'rec0_raw.fif'), '--funcs', 'mean',
+                       '--format', 'hdf5', '--output-dir', output_dir,
+                       '--max-memory', '10M']), 0)
+    assert_equal(main([op.join(tempdir, 'rec0_raw.fif'), '--funcs', 'mean',
+                       '--output-dir', output_dir, '--max-memory', 'foo']), 1)
+    # Negative number of jobs (counted from the number of CPUs)
+    assert_equal(main([op.join(tempdir, 'rec0_raw.fif'), '--funcs', 'mean',
+                       '--format', 'hdf5', '--output-dir', output_dir,
+                       '--n-jobs', '-2']), 0)
+    assert_equal(main([op.join(tempdir, 'rec0_raw.fif'), '--funcs', 'mean',
+                       '--output-dir', output_dir, '--n-jobs', '0']), 1)
+    # Invalid feature function
+    assert_equal(main([op.join(tempdir, '*_raw.fif'), '--funcs', 'foo',
+                       '--output-dir', output_dir, '--format', 'hdf5']), 1)
+    # No input file
+    assert_equal(main([op.join(tempdir, '*.edf'), '--funcs', 'mean']), 1)
+
+
+if __name__ == '__main__':
+
+    test_cli()
@@ -3,12 +3,38 @@
 # License: BSD 3 clause
 
 
+import os
+import os.path as op
+from functools import partial
+from tempfile import mkdtemp
+from unittest import SkipTest
+
 import numpy as np
-from numpy.testing import assert_equal, assert_raises
+from sklearn.pipeline import FeatureUnion
+from numpy.testing import (assert_almost_equal, assert_equal, assert_raises,
+                           assert_warns)
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
 
+from mne_features import feature_extraction, univariate
 from mne_features.feature_extraction import (extract_features,
-                                             FeatureFunctionTransformer)
-from mne_features.univariate import compute_svd_fisher_info
+                                             FeatureFunctionTransformer,
+                                             register_feature,
+                                             register_intermediate,
+                                             _registered_funcs,
+                                             _intermediates,
+                                             _estimate_epoch_memory,
+                                             _memory_estimates,
+                                             _plan_memory)
+from mne_features.bivariate import (compute_nonlinear_interdep,
+                                    get_bivariate_funcs)
+from mne_features.univariate import (get_univariate_funcs,
+                                     compute_energy_freq_bands,
+                                     compute_svd_fisher_info,
+                                     compute_line_length)
 
 rng = np.random.RandomState(42)
 sfreq = 256.
@@ -16,12 +42,23 @@ data = rng.standard_normal((10, 20, int(sfreq)))
 n_epochs, n_channels = data.shape[:2]
 
 
+def _scaled_derivative(sfreq, data):
+    # Intermediate which is not a tuple of arrays
+    return np.diff(data, axis=-1), sfreq
+
+
+def _max_slope(data, scaled_derivative):
+    derivative, scale = scaled_derivative
+    return np.max(np.abs(derivative), axis=-1) * scale
+
+
 def test_shape_output():
-    sel_funcs = ['mean', 'variance', 'kurtosis', 'pow_freq_bands']
+    sel_funcs = ['mean', 'variance', 'kurtosis', 'pow_freq_bands',
+                 'energy_freq_bands']
     features = extract_features(data, sfreq, sel_funcs, n_jobs=1)
     features_as_df = extract_features(data, sfreq, sel_funcs,
                                       n_jobs=1, return_as_df=True)
-    expected_shape = (n_epochs, (3 + 5) * n_channels)
+    expected_shape = (n_epochs, (3 + 5 + 5) * n_channels)
     assert_equal(features.shape, expected_shape)
     assert_equal(features, features_as_df.values)
 
@@ -43,6 +80,12 @@ def test_optional_params():
     assert_equal(features1.shape[-1], n_channels)
     assert_equal(features3.shape[-1], n_channels)
     assert_equal(features2.shape[-1], features1.shape[-1] * 2)
+    features4 = extract_features(
+        data, sfreq, ['pow_freq_bands', 'spect_entropy'],
+        {'pow_freq_bands__psd_method': 'welch',
+         'pow_freq_bands__psd_params': {'n_per_seg': 128},
+         'spect_entropy__psd_method': 'welch'})
+    assert_equal(features4.shape[-1], n_channels * 6)
 
 
 def test_optional_params_func_with_numba():
@@ -85,6 +128,330 @@ def test_featurefunctiontransformer():
         tr2.set_params(**invalid_new_params)
 
 
+def test_register_feature():
+    n_calls = [0]
+
+    def _abs_derivative(sfreq, data):
+        n_calls[0] += 1
+        return np.abs(np.diff(data, axis=-1))
+
+    def _line_length(data, abs_derivative):
+        return np.sum(abs_derivative, axis=-1)
+
+    def _peak_freq(sfreq, data, psd, abs_derivative, fmin=0.):
+        ps, freqs = psd
+        ps = ps[:, freqs >= fmin]
+        return np.r_[freqs[freqs >= fmin][np.argmax(ps, axis=-1)],
+                     np.max(abs_derivative, axis=-1)]
+
+    try:
+        register_intermediate('abs_derivative', _abs_derivative)
+        register_feature('my_line_length', _line_length,
+                         n_outputs=lambda shape: shape[0],
+                         requires=['abs_derivative'])
+        register_feature('my_peak_freq', _peak_freq,
+                         n_outputs=lambda shape: 2 * shape[0],
+                         requires=['psd', 'abs_derivative'],
+                         needs_sfreq=True)
+        features = extract_features(data, sfreq,
+                                    ['my_line_length', 'my_peak_freq'],
+                                    {'my_peak_freq__fmin': 10.})
+        assert_equal(features.shape, (n_epochs, 3 * n_channels))
+        # The intermediate is computed once per epoch
+        assert_equal(n_calls[0], n_epochs)
+        assert_almost_equal(features[:, :n_channels],
+                            [compute_line_length(x) for x in data])
+        assert_equal(np.all(features[:, n_channels:2 * n_channels] >= 10.),
+                     True)
+        # Wrong number of outputs
+        register_feature('my_line_length', _line_length,
+                         n_outputs=lambda shape: shape[0] + 1,
+                         requires=['abs_derivative'])
+        with assert_raises(ValueError):
+            extract_features(data, sfreq, ['my_line_length'])
+    finally:
+        _registered_funcs.pop('my_line_length', None)
+        _registered_funcs.pop('my_peak_freq', None)
+        _intermediates.pop('abs_derivative', None)
+    # The intermediates are sent to the worker processes
+    try:
+        register_intermediate('scaled_derivative', _scaled_derivative)
+        register_feature('max_slope', _max_slope,
+                         requires=['scaled_derivative'])
+        expected = sfreq * np.max(np.abs(np.diff(data, axis=-1)), axis=-1)
+        for n_jobs in (1, 2):
+            assert_almost_equal(extract_features(data, sfreq, ['max_slope'],
+                                                 n_jobs=n_jobs), expected)
+    finally:
+        _registered_funcs.pop('max_slope', None)
+        _intermediates.pop('scaled_derivative', None)
+    with assert_raises(ValueError):
+        # Alias of a feature function of mne_features
+        register_feature('mean', _line_length)
+    with assert_raises(ValueError):
+        # Unknown intermediate
+        register_feature('my_line_length', _line_length,
+                         requires=['abs_derivative'])
+
+
+def test_output_file():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SkipTest('pyarrow is not installed.')
+    sel_funcs = ['mean', 'pow_freq_bands', 'plv']
+    fname = op.join(mkdtemp(), 'features.parquet')
+    out = extract_features(data, sfreq, sel_funcs, output_file=fname,
+                           chunk_size=3)
+    assert_equal(out, None)
+    features_as_df = extract_features(data, sfreq, sel_funcs,
+                                      return_as_df=True)
+    table = pq.read_table(fname)
+    assert_equal(table.num_rows, n_epochs)
+    assert_equal(table.column_names,
+                 ['__'.join(c) for c in features_as_df.columns])
+    assert_equal(table.to_pandas().values, features_as_df.values)
+
+
+def test_checkpoint_dir():
+    sel_funcs = ['mean', 'line_len']
+    checkpoint_dir = op.join(mkdtemp(), 'checkpoints')
+    expected = extract_features(data, sfreq, sel_funcs)
+    features = extract_features(data, sfreq, sel_funcs, chunk_size=3,
+                                checkpoint_dir=checkpoint_dir)
+    assert_equal(features, expected)
+    # Resume an interrupted extraction: the chunks saved in `checkpoint_dir`
+    # are not extracted again
+    chunk = op.join(checkpoint_dir, 'chunk_%09d.npy' % 3)
+    np.save(chunk, np.zeros((3, expected.shape[1])))
+    os.remove(op.join(checkpoint_dir, 'chunk_%09d.npy' % 6))
+    features = extract_features(data, sfreq, sel_funcs, chunk_size=3,
+                                checkpoint_dir=checkpoint_dir)
+    assert_equal(features[3:6], np.zeros((3, expected.shape[1])))
+    assert_equal(features[np.r_[0:3, 6:n_epochs]],
+                 expected[np.r_[0:3, 6:n_epochs]])
+    with assert_raises(ValueError):
+        # Checkpoints of a different extraction
+        extract_features(data, sfreq, sel_funcs, chunk_size=5,
+                         checkpoint_dir=checkpoint_dir)
+    with assert_raises(ValueError):
+        # Other data (with the same shape and the same first epoch)
+        other_data = data.copy()
+        other_data[-1] = data[-2]
+        extract_features(other_data, sfreq, sel_funcs, chunk_size=3,
+                         checkpoint_dir=checkpoint_dir)
+    # The size of the chunks planned from `max_memory` (which depends on the
+    # number of cores) is saved and reused when the extraction is resumed.
+    # With 8 cores, 7 workers process chunks of 7 epochs. With 2 cores, the
+    # planned chunk would hold all the epochs.
+    funcs = get_univariate_funcs(sfreq)
+    ext = FeatureUnion([(n, FeatureFunctionTransformer(func=funcs[n]))
+                        for n in sel_funcs])
+    epoch_memory = _estimate_epoch_memory(ext, sfreq, *data.shape[1:])
+    row_memory = 8 * expected.shape[1]
+    max_memory = (2 * n_epochs * row_memory +
+                  7 * (epoch_memory + 2 * row_memory))
+    checkpoint_dir = op.join(mkdtemp(), 'checkpoints')
+    cpu_count = feature_extraction.joblib.cpu_count
+    try:
+        feature_extraction.joblib.cpu_count = lambda: 8
+        extract_features(data, sfreq, sel_funcs, n_jobs=-1,
+                         max_memory=max_memory, checkpoint_dir=checkpoint_dir)
+        assert_equal(sorted(os.listdir(checkpoint_dir)),
+                     ['checkpoint.json', 'chunk_%09d.npy' % 0,
+                      'chunk_%09d.npy' % 7])
+        os.remove(op.join(checkpoint_dir, 'chunk_%09d.npy' % 7))
+        feature_extraction.joblib.cpu_count = lambda: 2
+        features = extract_features(data, sfreq, sel_funcs, n_jobs=-1,
+                                    max_memory=max_memory,
+                                    checkpoint_dir=checkpoint_dir)
+    finally:
+        feature_extraction.joblib.cpu_count = cpu_count
+    assert_equal(sorted(os.listdir(checkpoint_dir)),
+                 ['checkpoint.json', 'chunk_%09d.npy' % 0,
+                  'chunk_%09d.npy' % 7])
+    assert_equal(features, expected)
+
+
+def test_on_error():
+    failing_epochs = [2, 5]
+
+    def _faulty(data):
+        if np.any(np.in1d(failing_epochs, np.round(data[:, 0] * 1e6))):
+            raise FloatingPointError('log(0)')
+        return np.mean(data, axis=-1)
+
+    _data = data.copy()
+    _data[:, 0, 0] = np.arange(n_epochs) * 1e-6
+    try:
+        register_feature('faulty', _faulty, n_outputs=lambda s: s[0])
+        sel_funcs = ['faulty', 'line_len']
+        expected = extract_features(_data, sfreq, ['mean', 'line_len'])
+        with assert_raises(FloatingPointError):
+            extract_features(_data, sfreq, sel_funcs)
+        with assert_raises(ValueError):
+            extract_features(_data, sfreq, sel_funcs, on_error='foo')
+        error_log = list()
+        with assert_warns(UserWarning):
+            features = extract_features(_data, sfreq, sel_funcs,
+                                        on_error='nan', error_log=error_log)
+        assert_equal(error_log, [(j, 'faulty', 'FloatingPointError: log(0)')
+                                 for j in failing_epochs])
+        assert_equal(np.isnan(features[:, :n_channels]).any(axis=1),
+                     np.in1d(np.arange(n_epochs), failing_epochs))
+        kept = np.setdiff1d(np.arange(n_epochs), failing_epochs)
+        assert_equal(features[kept], expected[kept])
+        assert_equal(features[failing_epochs, n_channels:],
+                     expected[failing_epochs, n_channels:])
+        with assert_warns(UserWarning):
+            df = extract_features(_data, sfreq, sel_funcs, on_error='skip',
+                                  return_as_df=True, chunk_size=3,
+                                  checkpoint_dir=op.join(mkdtemp(), 'ckpt'))
+        assert_equal(df.index.values, kept)
+        assert_equal(df.values, expected[kept])
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SkipTest('pyarrow is not installed.')
+        # The indices of the remaining epochs are written to the output file
+        fname = op.join(mkdtemp(), 'features.parquet')
+        with assert_warns(UserWarning):
+            extract_features(_data, sfreq, sel_funcs, on_error='skip',
+                             output_file=fname, chunk_size=3)
+        output = pq.read_table(fname).to_pandas()
+        assert_equal(output['epoch'].values, kept)
+        assert_equal(output.values[:, 1:], expected[kept])
+    finally:
+        _registered_funcs.pop('faulty', None)
+
+
+def test_on_error_all_epochs():
+    def _always_faulty(data):
+        raise FloatingPointError('log(0)')
+
+    def _zero_faulty(data):
+        if np.any(data == 0):
+            raise FloatingPointError('log(0)')
+        return np.mean(data, axis=-1)
+
+    _data = data.copy()
+    _data[:, 0, 0] = 0.
+    expected = extract_features(_data, sfreq, ['line_len'])
+    try:
+        register_feature('always_faulty', _always_faulty,
+                         n_outputs=lambda s: 2 * s[0])
+        register_feature('zero_faulty', _zero_faulty)
+        register_feature('unknown_faulty', _always_faulty)
+        # The number of outputs of the feature functions which fail on all
+        # the epochs is given by `n_outputs` or obtained from random data
+        with assert_warns(UserWarning):
+            df = extract_features(
+                _data, sfreq, ['always_faulty', 'zero_faulty', 'line_len'],
+                on_error='nan', return_as_df=True)
+        assert_equal(df.shape, (n_epochs, 4 * n_channels))
+        assert_equal(np.isnan(df['always_faulty'].values).all(), True)
+        assert_equal(np.isnan(df['zero_faulty'].values).all(), True)
+        assert_equal(df['line_len'].values, expected)
+        with assert_raises(ValueError):
+            extract_features(_data, sfreq, ['unknown_faulty', 'line_len'],
+                             on_error='nan')
+    finally:
+        for alias in ('always_faulty', 'zero_faulty', 'unknown_faulty'):
+            _registered_funcs.pop(alias, None)
+
+
+def test_batch_funcs():
+    sel_funcs = ['mean', 'pow_freq_bands', 'time_corr', 'spect_corr']
+    funcs = get_univariate_funcs(sfreq)
+    funcs.update(get_bivariate_funcs(sfreq))
+    # The DC component of the spectrum is 0 (hence -inf in dB)
+    funcs['spect_corr'] = partial(funcs['spect_corr'], db=False)
+    funcs_params = {'spect_corr__db': False}
+    expected = np.vstack([np.concatenate([funcs[alias](x)
+                                          for alias in sel_funcs])
+                          for x in data])
+    n_calls = list()
+    pow_freq_bands = univariate.compute_power_spectrum_freq_bands
+
+    def _pow_freq_bands(sfreq, data):
+        n_calls.append(data.shape[0])
+        return pow_freq_bands(sfreq, data)
+
+    try:
+        univariate.compute_power_spectrum_freq_bands = _pow_freq_bands
+        # The batch feature functions are applied once per chunk
+        features = extract_features(data, sfreq, sel_funcs, funcs_params,
+                                    chunk_size=4,
+                                    checkpoint_dir=op.join(mkdtemp(), 'ck'))
+        assert_almost_equal(features, expected)
+        assert_equal(n_calls, [n_channels, 4, 4, 2])
+    finally:
+        univariate.compute_power_spectrum_freq_bands = pow_freq_bands
+    # If a batch feature function fails on a chunk, it is applied epoch by
+    # epoch (so that the errors are attributed to the epochs)
+    _data = data.copy()
+    _data[3, 0, 0] = np.nan
+    error_log = list()
+    with assert_warns(UserWarning):
+        features = extract_features(_data, sfreq, ['pow_freq_bands'],
+                                    on_error='nan', error_log=error_log)
+    assert_equal([error[:2] for error in error_log], [(3, 'pow_freq_bands')])
+    kept = np.r_[0:3, 4:n_epochs]
+    assert_almost_equal(features[kept], expected[kept, n_channels:][
+        :, :features.shape[1]])
+    assert_equal(np.isnan(features[3]).all(), True)
+
+
+def test_max_memory():
+    sel_funcs = ['mean', 'energy_freq_bands', 'nonlin_interdep']
+    expected = extract_features(data, sfreq, sel_funcs)
+    features = extract_features(data, sfreq, sel_funcs, n_jobs=-1,
+                                max_memory='64M')
+    assert_almost_equal(features, expected)
+    with assert_warns(UserWarning):
+        features = extract_features(data, sfreq, sel_funcs, max_memory=1000)
+    assert_almost_equal(features, expected)
+    for max_memory in ('foo', -1):
+        with assert_raises(ValueError):
+            extract_features(data, sfreq, sel_funcs, max_memory=max_memory)
+    # The memory estimates are given for actual feature functions
+    aliases = set(get_univariate_funcs(sfreq))
+    aliases.update(get_bivariate_funcs(sfreq))
+    assert_equal(set(_memory_estimates) - aliases, set())
+    # The estimated memory grows with the parameters of the functions
+    ext = FeatureUnion([('nonlin_interdep', FeatureFunctionTransformer(
+        func=compute_nonlinear_interdep))])
+    memory = _estimate_epoch_memory(ext, sfreq, n_channels, int(sfreq))
+    ext.set_params(nonlin_interdep__emb=20)
+    assert_equal(_estimate_epoch_memory(ext, sfreq, n_channels,
+                                        int(sfreq)) > memory, True)
+    # The estimated memory of `energy_freq_bands` exceeds its actual peak
+    # memory (the epoch is included in both)
+    ext = FeatureUnion([('energy_freq_bands', FeatureFunctionTransformer(
+        func=partial(compute_energy_freq_bands, sfreq)))])
+    for n_times in (int(2 * sfreq), int(10 * sfreq)):
+        if tracemalloc is None:
+            break
+        x = rng.standard_normal((8, n_times))
+        compute_energy_freq_bands(sfreq, x)
+        tracemalloc.start()
+        compute_energy_freq_bands(sfreq, x)
+        peak = tracemalloc.get_traced_memory()[1] + x.nbytes
+        tracemalloc.stop()
+        assert_equal(_estimate_epoch_memory(ext, sfreq, 8, n_times) > peak,
+                     True)
+    # The number of workers is chosen first, then the size of the chunks
+    assert_equal(_plan_memory(10 ** 6, 10 ** 5, 100, 10, 4, 100, False),
+                 (4, 100))
+    assert_equal(_plan_memory(10 ** 6, 10 ** 5, 100, 10, 4, 1000, False),
+                 (4, 375))
+    assert_equal(_plan_memory(10 ** 6, 2 * 10 ** 5, 100, 10, 8, 1000, False),
+                 (4, 125))
+    # The extracted features are kept in memory
+    assert_equal(_plan_memory(10 ** 6, 10 ** 5, 100, 500, 4, 1000, True),
+                 (1, 62))
+
+
 if __name__ == '__main__':
 
     test_shape_output()
@@ -93,3 +460,10 @@ if __name__ == '__main__':
     test_optional_params_func_with_numba()
     test_wrong_params()
     test_featurefunctiontransformer()
+    test_register_feature()
+    test_output_file()
+    test_checkpoint_dir()
+    test_on_error()
+    test_on_error_all_epochs()
+    test_batch_funcs()
+    test_max_memory()
@@ -5,8 +5,13 @@
 
 import numpy as np
 from numpy.testing import assert_equal, assert_almost_equal
+from scipy import stats
 
-from mne_features.univariate import (_slope_lstsq, compute_mean,
+from mne_features.univariate import (_slope_lstsq, _slope_lstsq_numpy,
+                                     _accumulate_std, _accumulate_std_numpy,
+                                     _app_entropy, _app_entropy_numpy,
+                                     _samp_entropy, _samp_entropy_numpy,
+                                     compute_mean,
                                      compute_variance, compute_std,
                                      compute_ptp, compute_skewness,
                                      compute_kurtosis, compute_hurst_exponent,
@@ -26,6 +31,7 @@ from mne_features.univariate import (_slope_lstsq, compute_mean,
                                      compute_energy_freq_bands,
                                      compute_spect_edge_freq,
                                      compute_wavelet_coef_energy)
+from mne_features.utils import power_spectrum
 
 rng = np.random.RandomState(42)
 sfreq = 256.
@@ -43,6 +49,19 @@ def test_slope_lstsq():
     assert_almost_equal(s1, s2)
 
 
+def test_numpy_fallbacks():
+    # The NumPy versions of the kernels (used if Numba is not available)
+    # give the same results as the original ones
+    x = data[0, :3, :]
+    assert_almost_equal(_app_entropy_numpy(x), _app_entropy(x))
+    assert_almost_equal(_samp_entropy_numpy(x), _samp_entropy(x))
+    assert_almost_equal(_slope_lstsq_numpy(x[0], x[1]),
+                        _slope_lstsq(x[0], x[1]))
+    y = np.round(2 * x[0])
+    y[:5] = 1.
+    assert_almost_equal(_accumulate_std_numpy(y), _accumulate_std(y))
+
+
 def test_shape_output():
     for func in (compute_mean, compute_variance, compute_std,
                  compute_kurtosis, compute_skewness, compute_ptp,
@@ -56,12 +75,59 @@ def test_shape_output():
             assert_equal(feat.shape, (n_channels,))
 
 
+def test_moments():
+    x = data[0] ** 3
+    assert_almost_equal(compute_mean(x), np.mean(x, axis=-1))
+    assert_almost_equal(compute_variance(x), np.var(x, axis=-1, ddof=1))
+    assert_almost_equal(compute_std(x), np.std(x, axis=-1, ddof=1))
+    assert_almost_equal(compute_ptp(x), np.ptp(x, axis=-1))
+    assert_almost_equal(compute_skewness(x), stats.skew(x, axis=-1))
+    assert_almost_equal(compute_kurtosis(x),
+                        stats.kurtosis(x, axis=-1, fisher=False))
+    flat = np.ones((2, 100))
+    assert_equal(compute_skewness(flat), [0., 0.])
+    assert_equal(compute_kurtosis(flat), [0., 0.])
+    # Batch of epochs (and list input)
+    for func in (compute_mean, compute_variance, compute_std, compute_ptp,
+                 compute_skewness, compute_kurtosis):
+        assert_almost_equal(func(data), [func(x) for x in data])
+    assert_almost_equal(compute_variance(data[0].tolist()),
+                        compute_variance(data[0]))
+
+
+def test_hjorth():
+    def _mobility(x):
+        x = np.insert(x, 0, 0, axis=-1)
+        return np.std(np.diff(x, axis=-1), ddof=1, axis=-1) / np.std(
+            x, ddof=1, axis=-1)
+    x = data[0] + 10.
+    dx = np.diff(np.insert(x, 0, 0, axis=-1), axis=-1)
+    assert_almost_equal(compute_hjorth_mobility(x), _mobility(x))
+    assert_almost_equal(compute_hjorth_complexity(x),
+                        _mobility(dx) / _mobility(x))
+
+
+def test_higuchi_fd():
+    # The Higuchi FD of a straight line is 1 and the one of a white noise is
+    # close to 2
+    x = np.vstack((np.arange(1000.), rng.standard_normal((1000,))))
+    hfd = compute_higuchi_fd(x, kmax=5)
+    assert_almost_equal(hfd, [1., 2.], decimal=1)
+
+
 def test_shape_output_decorr_time():
     for j in range(n_epochs):
         feat = compute_decorr_time(sfreq, data[j, :, :])
         assert_equal(feat.shape, (n_channels,))
 
 
+def test_decorr_time_batch():
+    feat = compute_decorr_time(sfreq, data)
+    assert_equal(feat.shape, (n_epochs, n_channels))
+    for j in range(n_epochs):
+        assert_almost_equal(feat[j], compute_decorr_time(sfreq, data[j]))
+
+
 def test_shape_output_power_spectrum_freq_bands():
     fb = np.array([0.1, 4, 8, 12, 30])
     n_freqs = fb.shape[0]
@@ -71,6 +137,19 @@ def test_shape_output_power_spectrum_freq_bands():
         assert_equal(feat.shape, (n_channels * (n_freqs - 1),))
 
 
+def test_power_spectrum_freq_bands():
+    fb = np.array([0.1, 4, 8, 12, 30])
+    feat = compute_power_spectrum_freq_bands(sfreq, data, freq_bands=fb,
+                                             normalize=False)
+    assert_equal(feat.shape, (n_epochs, n_channels * 4))
+    for j in range(n_epochs):
+        ps, freqs = power_spectrum(sfreq, data[j])
+        idx = np.digitize(freqs, fb)
+        expected = np.vstack([np.sum(ps[:, idx == k], axis=-1)
+                              for k in range(1, 5)]).T.ravel()
+        assert_almost_equal(feat[j], expected)
+
+
 def test_shape_output_spect_hjorth_mobility():
     for j in range(n_epochs):
         feat = compute_spect_hjorth_mobility(sfreq, data[j, :, :])
@@ -104,18 +183,43 @@ def test_shape_output_spect_edge_freq():
         assert_equal(feat.shape, (n_channels * 4,))
 
 
+def test_spect_edge_freq():
+    edge = [50., 80., 100.]
+    feat = compute_spect_edge_freq(sfreq, data, ref_freq=60., edge=edge)
+    assert_equal(feat.shape, (n_epochs, n_channels * 3))
+    for j in range(n_epochs):
+        assert_almost_equal(feat[j], compute_spect_edge_freq(
+            sfreq, data[j], ref_freq=60., edge=edge))
+    assert_equal(feat[:, 2::3], 60.)
+
+
 def test_shape_output_wavelet_coef_energy():
     feat = compute_wavelet_coef_energy(data[0, :, :], wavelet_name='haar')
     assert_equal(feat.shape, (n_channels * 6,))
 
 
+def test_wavelet_coef_energy_batch():
+    feat = compute_wavelet_coef_energy(data, wavelet_name='db4')
+    assert_equal(feat.shape, (n_epochs, n_channels * 5))
+    for j in range(n_epochs):
+        assert_almost_equal(feat[j], compute_wavelet_coef_energy(data[j]))
+
+
 if __name__ == '__main__':
 
     test_slope_lstsq()
+    test_numpy_fallbacks()
     test_shape_output()
+    test_moments()
+    test_hjorth()
+    test_higuchi_fd()
     test_shape_output_decorr_time()
+    test_decorr_time_batch()
     test_shape_output_power_spectrum_freq_bands()
+    test_power_spectrum_freq_bands()
     test_shape_output_spect_entropy()
     test_shape_output_energy_freq_bands()
     test_shape_output_spect_edge_freq()
+    test_spect_edge_freq()
     test_shape_output_wavelet_coef_energy()
+    test_wavelet_coef_energy_batch()
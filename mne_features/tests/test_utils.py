@@ -4,10 +4,13 @@
 
 
 import numpy as np
-from numpy.testing import assert_almost_equal, assert_equal
+from numpy.testing import assert_almost_equal, assert_equal, assert_raises
+from mne.filter import filter_data
 from scipy import signal
 
-from mne_features.utils import triu_idx, power_spectrum, embed, filt
+from mne_features.utils import (triu_idx, power_spectrum, embed, filt,
+                                filt_bands, memoize_epoch,
+                                epoch_cache, _lru_cache)
 
 rng = np.random.RandomState(42)
 sfreq = 256.
@@ -30,6 +33,32 @@ def test_psd():
     assert_almost_equal(pxx, ps)
 
 
+def test_power_spectrum_psd_method():
+    _data = data - np.mean(data, axis=-1)[:, None]
+    ps, freqs = power_spectrum(sfreq, data, psd_method='welch',
+                               psd_params={'n_per_seg': 64})
+    assert_equal(ps.shape, (data.shape[0], 33))
+    assert_almost_equal(freqs, np.fft.rfftfreq(64, 1. / sfreq))
+    assert_almost_equal(np.sum(ps, axis=-1) / np.mean(_data ** 2, axis=-1),
+                        np.ones((data.shape[0],)), decimal=0)
+    ps, freqs = power_spectrum(sfreq, data, psd_method='multitaper')
+    assert_equal(ps.shape, (data.shape[0], data.shape[-1] // 2 + 1))
+    assert_almost_equal(np.sum(ps, axis=-1) / np.mean(_data ** 2, axis=-1),
+                        np.ones((data.shape[0],)), decimal=1)
+    # Unhashable parameters (the result is then not cached)
+    psd_params = {'n_per_seg': 64, 'window': np.hanning(64)}
+    ps, _ = power_spectrum(sfreq, data, psd_method='welch',
+                           psd_params=psd_params)
+    with epoch_cache():
+        assert_almost_equal(power_spectrum(sfreq, data, psd_method='welch',
+                                           psd_params=psd_params)[0], ps)
+    with assert_raises(ValueError):
+        power_spectrum(sfreq, data, psd_method='periodogram')
+    with assert_raises(ValueError):
+        power_spectrum(sfreq, data, psd_method='welch',
+                       psd_params={'bandwidth': 2.})
+
+
 def test_triu_idx():
     n_channels = data.shape[0]
     idx0, idx1 = np.triu_indices(n_channels)
@@ -45,17 +74,89 @@ def test_shape_output_embed():
     assert_equal(emb_data.shape, expected)
 
 
+def test_embed():
+    d, tau = 3, 4
+    emb_data = embed(data, d=d, tau=tau)
+    n_vectors = data.shape[-1] - 1 - (d - 1) * tau
+    expected = np.stack([data[:, j * tau:j * tau + n_vectors]
+                         for j in range(d)], axis=-1)
+    assert_almost_equal(emb_data, expected)
+    assert_equal(np.may_share_memory(emb_data, data), True)
+    assert_equal(emb_data.flags.writeable, False)
+
+
+def test_memoize_epoch():
+    n_calls = list()
+
+    @memoize_epoch
+    def _func(x, a):
+        n_calls.append(a)
+        return a * x
+
+    with epoch_cache():
+        out1 = _func(data, 2)
+        out2 = _func(data, 2)
+        assert_equal(out1 is out2, True)
+        assert_equal(out1.flags.writeable, False)
+        _func(data, 3)
+        _func(data.copy(), 3)
+    assert_equal(n_calls, [2, 3, 3])
+    # Without epoch cache, the function is called as usual (and the data can
+    # be modified between two calls)
+    x = data.copy()
+    out1 = _func(x, 2)
+    x += 1.
+    out2 = _func(x, 2)
+    assert_almost_equal(out2 - out1, 2.)
+    assert_equal(out2.flags.writeable, True)
+    assert_equal(n_calls, [2, 3, 3, 2, 2])
+
+
+def test_lru_cache():
+    n_calls = list()
+
+    @_lru_cache(maxsize=2)
+    def _func(a):
+        n_calls.append(a)
+        return 2 * a
+
+    for a in (1, 2, 1, 3, 1, 2):
+        assert_equal(_func(a), 2 * a)
+    # 2 is evicted when 3 is added (1 being the most recently used)
+    assert_equal(n_calls, [1, 2, 3, 2])
+    assert_equal(list(_func.cache.keys()), [(1,), (2,)])
+
+
 def test_filt():
     filt_low_pass = filt(sfreq, data, [None, 50.])
     filt_bandpass = filt(sfreq, data, [1., 70.])
     assert_equal(filt_low_pass.shape, data.shape)
     assert_equal(filt_bandpass.shape, data.shape)
+    for filter_freqs in ([None, 50.], [1., None], [1., 70.], [70., 1.]):
+        assert_almost_equal(filt(sfreq, data, filter_freqs),
+                            filter_data(data, sfreq, filter_freqs[0],
+                                        filter_freqs[1], fir_design='firwin',
+                                        verbose='error'))
+
+
+def test_filt_bands():
+    freq_bands = np.array([0.5, 4., 8., 13., 30., 100.])
+    filt_data = filt_bands(sfreq, data, freq_bands)
+    assert_equal(filt_data.shape, (5,) + data.shape)
+    for j in range(5):
+        assert_almost_equal(filt_data[j],
+                            filt(sfreq, data, freq_bands[j:(j + 2)]))
 
 
 if __name__ == '__main__':
 
     test_power_spectrum()
     test_psd()
+    test_power_spectrum_psd_method()
     test_triu_idx()
     test_shape_output_embed()
+    test_embed()
+    test_memoize_epoch()
+    test_lru_cache()
     test_filt()
+    test_filt_bands()
@@ -0,0 +1,112 @@
+# Author: Jean-Baptiste Schiratti <jean.baptiste.schiratti@gmail.com>
+#         Alexandre Gramfort <alexandre.gramfort@inria.fr>
+# License: BSD 3 clause
+
+
+import os.path as op
+from tempfile import mkdtemp
+from unittest import SkipTest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal, assert_raises
+
+from mne_features.writers import FeatureWriter
+
+rng = np.random.RandomState(42)
+columns = ['mean__ch%s' % j for j in range(4)] + ['plv__0', 'plv__1']
+X = rng.standard_normal((25, len(columns)))
+
+
+def _write_chunks(fname):
+    with FeatureWriter(fname, columns) as writer:
+        for start in range(0, X.shape[0], 10):
+            writer.write(X[start:(start + 10)])
+    assert_equal(writer.n_epochs_, X.shape[0])
+
+
+def test_parquet_writer():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SkipTest('pyarrow is not installed.')
+    fname = op.join(mkdtemp(), 'features.parquet')
+    _write_chunks(fname)
+    table = pq.read_table(fname)
+    assert_equal(table.column_names, columns)
+    assert_almost_equal(table.to_pandas().values, X)
+
+
+def test_arrow_writer():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise SkipTest('pyarrow is not installed.')
+    fname = op.join(mkdtemp(), 'features.arrow')
+    _write_chunks(fname)
+    table = pa.ipc.open_file(pa.memory_map(fname)).read_all()
+    assert_equal(table.column_names, columns)
+    assert_almost_equal(table.to_pandas().values, X)
+
+
+def test_hdf5_writer():
+    try:
+        import h5py
+    except ImportError:
+        raise SkipTest('h5py is not installed.')
+    fname = op.join(mkdtemp(), 'features.h5')
+    _write_chunks(fname)
+    with h5py.File(fname, 'r') as f:
+        assert_equal([c.decode() for c in f['columns'][:]], columns)
+        assert_almost_equal(f['features'][:], X)
+
+
+def test_index():
+    try:
+        import h5py
+    except ImportError:
+        raise SkipTest('h5py is not installed.')
+    fname = op.join(mkdtemp(), 'features.h5')
+    index = np.arange(0, 2 * X.shape[0], 2)
+    with FeatureWriter(fname, columns, index_name='epoch') as writer:
+        writer.write(X[:10], index[:10])
+        writer.write(X[10:], index[10:])
+        with assert_raises(ValueError):
+            writer.write(X[:10])
+        with assert_raises(ValueError):
+            writer.write(X[:10], index[:5])
+    with h5py.File(fname, 'r') as f:
+        assert_equal(f['epoch'][:], index)
+        assert_almost_equal(f['features'][:], X)
+
+
+def test_interrupted_write():
+    try:
+        import h5py  # noqa
+    except ImportError:
+        raise SkipTest('h5py is not installed.')
+    fname = op.join(mkdtemp(), 'features.h5')
+    with assert_raises(RuntimeError):
+        with FeatureWriter(fname, columns) as writer:
+            writer.write(X[:10])
+            assert_equal(op.exists(fname), False)
+            raise RuntimeError('Interrupted extraction.')
+    assert_equal(op.exists(fname), False)
+    assert_equal(op.exists(fname + '.tmp'), False)
+
+
+def test_wrong_output_file():
+    with assert_raises(ValueError):
+        FeatureWriter(op.join(mkdtemp(), 'features.txt'), columns)
+    with assert_raises(ValueError):
+        FeatureWriter(op.join(mkdtemp(), 'features.h5'), columns,
+                      index_name=columns[0])
+
+
+if __name__ == '__main__':
+
+    test_parquet_writer()
+    test_arrow_writer()
+    test_hdf5_writer()
+    test_index()
+    test_interrupted_write()
+    test_wrong_output_file()
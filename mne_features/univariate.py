@@ -4,15 +4,16 @@
 
 
 from functools import partial
-from math import sqrt, log, floor
+from math import sqrt, log
 
 import numpy as np
 import pywt
-from scipy import stats, signal
+from scipy.fftpack import next_fast_len
 from scipy.ndimage import convolve1d
 
-from .mock_numba import nb
-from .utils import power_spectrum, embed, filt
+from .mock_numba import nb, has_numba
+from .utils import (power_spectrum, embed, filt_bands, memoize_epoch,
+                    _freq_bands_matrix, _lru_cache)
 
 
 def get_univariate_funcs(sfreq):
@@ -58,29 +59,62 @@ def get_univariate_funcs(sfreq):
     univariate_funcs['spect_edge_freq'] = partial(compute_spect_edge_freq,
                                                   sfreq)
     univariate_funcs['wavelet_coef_energy'] = compute_wavelet_coef_energy
+    univariate_funcs['energy_freq_bands'] = partial(compute_energy_freq_bands,
+                                                    sfreq)
     return univariate_funcs
 
 
 def _unbiased_autocorr(x):
-    """ Unbiased autocorrelation.
+    """ Unbiased autocorrelation (computed for non-negative lags only).
+
+    The autocorrelation is computed in the frequency domain, with a single
+    zero-padded real FFT over the last axis of `x`.
 
     Parameters
     ----------
-    x : ndarray, shape (n_times,)
+    x : ndarray, shape (..., n_times)
 
     Returns
     -------
-    ndarray, shape (2 * n_times + 1,)
+    ndarray, shape (..., n_times)
+        Autocorrelation for the lags `0, 1, ..., n_times - 1`.
     """
-    m = x.shape[0] - 1
-    lags = np.arange(-m, m + 1)
-    s = np.add(m, - np.abs(lags))
-    s[np.where(s <= 0)] = 1
-    autocorr = signal.fftconvolve(x, x[::-1], mode='full')
+    n_times = x.shape[-1]
+    n_fft = next_fast_len(2 * n_times - 1)
+    spect = np.fft.rfft(x, n_fft, axis=-1)
+    autocorr = np.fft.irfft(spect.real ** 2 + spect.imag ** 2, n_fft,
+                            axis=-1)[..., :n_times]
+    s = (n_times - 1) - np.arange(n_times)
+    s[s <= 0] = 1
     autocorr /= s
     return autocorr
 
 
+@memoize_epoch
+def _svd_spectrum(data, tau, emb):
+    """ Normalized singular values of the time-delay embedding of the data
+    (per channel). The singular values are computed once per epoch and shared
+    by the SVD-based feature functions.
+
+    Parameters
+    ----------
+    data : ndarray, shape (n_channels, n_times)
+
+    tau : int
+        Delay (number of samples).
+
+    emb : int
+        Embedding dimension.
+
+    Returns
+    -------
+    output : ndarray, shape (n_channels, emb)
+        Singular values (in decreasing order) normalized by their sum.
+    """
+    sv = np.linalg.svd(embed(data, d=emb, tau=tau), compute_uv=False)
+    return sv / np.sum(sv, axis=-1)[:, None]
+
+
 @nb.jit([nb.float64(nb.float64[:], nb.float64[:]),
          nb.float32(nb.float32[:], nb.float32[:])], nopython=True)
 def _slope_lstsq(x, y):
@@ -112,6 +146,27 @@ def _slope_lstsq(x, y):
     return num / den
 
 
+def _slope_lstsq_numpy(x, y):
+    """ Vectorized (NumPy) version of `_slope_lstsq` (used if Numba is not
+    available).
+
+    Parameters
+    ----------
+    x : ndarray, shape (n_times,)
+
+    y : ndarray, shape (n_times,)
+
+    Returns
+    -------
+    float
+    """
+    n_times = x.shape[0]
+    sx = np.sum(x)
+    den = n_times * np.dot(x, x) - (sx ** 2)
+    num = n_times * np.dot(x, y) - sx * np.sum(y)
+    return num / den
+
+
 @nb.jit([nb.float64[:](nb.float64[:]), nb.float32[:](nb.float32[:])],
         nopython=True)
 def _accumulate_std(x):
@@ -129,6 +184,79 @@ def _accumulate_std(x):
     return r
 
 
+def _accumulate_std_numpy(x):
+    """ Vectorized (NumPy) version of `_accumulate_std` (used if Numba is not
+    available). The standard deviation (with ddof=1) of each of the prefixes
+    `x[:(j + 1)]` is obtained from cumulative sums.
+
+    Parameters
+    ----------
+    x : ndarray, shape (n_times,)
+
+    Returns
+    -------
+    output : ndarray, shape (n_times,)
+    """
+    # Centering the data limits the cancellation errors in the cumulative
+    # sums
+    y = x - np.mean(x)
+    n = np.arange(1, x.shape[0] + 1)
+    s1 = np.cumsum(y)
+    s2 = np.cumsum(y ** 2)
+    var = np.zeros(x.shape)
+    var[1:] = (s2[1:] - s1[1:] ** 2 / n[1:]) / (n[1:] - 1)
+    # The standard deviation of a constant prefix is exactly 0
+    var[np.maximum.accumulate(x) == np.minimum.accumulate(x)] = 0.
+    return np.sqrt(np.maximum(var, 0.)).astype(x.dtype)
+
+
+@memoize_epoch
+def _mean(data):
+    """ Mean of the data (per channel), shared by the feature functions based
+    on the mean or on the central moments.
+
+    Parameters
+    ----------
+    data : ndarray, shape (..., n_channels, n_times)
+
+    Returns
+    -------
+    output : ndarray, shape (..., n_channels, 1)
+    """
+    return np.mean(data, axis=-1, keepdims=True)
+
+
+@memoize_epoch
+def _central_moments(data):
+    """ Central moments (of order 2, 3 and 4) of the data (per channel). They
+    are computed once per epoch and shared by the variance, standard
+    deviation, skewness and kurtosis.
+
+    Parameters
+    ----------
+    data : ndarray, shape (..., n_channels, n_times)
+
+    Returns
+    -------
+    m2 : ndarray, shape (..., n_channels)
+        Second central moment (biased variance).
+
+    m3 : ndarray, shape (..., n_channels)
+        Third central moment.
+
+    m4 : ndarray, shape (..., n_channels)
+        Fourth central moment.
+    """
+    dev = np.asarray(data) - _mean(data)
+    dev2 = dev ** 2
+    m2 = np.mean(dev2, axis=-1)
+    dev *= dev2
+    m3 = np.mean(dev, axis=-1)
+    dev2 **= 2
+    m4 = np.mean(dev2, axis=-1)
+    return m2, m3, m4
+
+
 def compute_mean(data):
     """ Mean of the data (per channel).
 
@@ -140,7 +268,7 @@ def compute_mean(data):
     -------
     output : ndarray, shape (n_channels,)
     """
-    return np.mean(data, axis=-1)
+    return _mean(data)[..., 0].copy()
 
 
 def compute_variance(data):
@@ -154,7 +282,8 @@ def compute_variance(data):
      -------
      output : ndarray, shape (n_channels,)
      """
-    return np.var(data, axis=-1, ddof=1)
+    n_times = np.shape(data)[-1]
+    return _central_moments(data)[0] * n_times / (n_times - 1)
 
 
 def compute_std(data):
@@ -168,7 +297,7 @@ def compute_std(data):
     -------
     output : ndarray, shape (n_channels)
     """
-    return np.std(data, axis=-1, ddof=1)
+    return np.sqrt(compute_variance(data))
 
 
 def compute_ptp(data):
@@ -195,10 +324,11 @@ def compute_skewness(data):
     Returns
     -------
     output : ndarray, shape (n_channels,)
+        The skewness of a constant channel is 0.
     """
-
-    ndim = data.ndim
-    return stats.skew(data, axis=ndim - 1)
+    m2, m3, _ = _central_moments(data)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(m2 == 0, 0., m3 / m2 ** 1.5)
 
 
 def compute_kurtosis(data):
@@ -211,10 +341,11 @@ def compute_kurtosis(data):
     Returns
     -------
     output : ndarray, shape (n_channels,)
+        The kurtosis of a constant channel is 0.
     """
-
-    ndim = data.ndim
-    return stats.kurtosis(data, axis=ndim - 1, fisher=False)
+    m2, _, m4 = _central_moments(data)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(m2 == 0, 0., m4 / m2 ** 2)
 
 
 def compute_hurst_exponent(data):
@@ -238,21 +369,24 @@ def compute_hurst_exponent(data):
     """
     n_channels = data.shape[0]
     hurst_exponent = np.empty((n_channels,))
+    if has_numba:
+        accumulate_std, slope_lstsq = _accumulate_std, _slope_lstsq
+    else:
+        accumulate_std = _accumulate_std_numpy
+        slope_lstsq = _slope_lstsq_numpy
     for j in range(n_channels):
         m = np.mean(data[j, :])
         y = data[j, :] - m
         z = np.cumsum(y)
         r = (np.maximum.accumulate(z) - np.minimum.accumulate(z))[1:]
-        s = _accumulate_std(data[j, :])[1:]
+        s = accumulate_std(data[j, :])[1:]
         s[np.where(s == 0)] = 1e-12  # avoid dividing by 0
         y_reg = np.log(r / s)
         x_reg = np.log(np.arange(1, y_reg.shape[0] + 1))
-        hurst_exponent[j] = _slope_lstsq(x_reg, y_reg)
+        hurst_exponent[j] = slope_lstsq(x_reg, y_reg)
     return hurst_exponent.ravel()
 
 
-@nb.jit([nb.float64[:](nb.float64[:, :]), nb.float32[:](nb.float32[:, :])],
-        nopython=True)
 def compute_app_entropy(data):
     """ Approximate Entropy (AppEn, per channel) [1].
 
@@ -270,6 +404,26 @@ def compute_app_entropy(data):
            studies on the prediction of epileptic seizures. Journal of
            Neuroscience Methods, 200(2), 257-271.
     """
+    if has_numba:
+        return _app_entropy(data)
+    else:
+        return _app_entropy_numpy(data)
+
+
+@nb.jit([nb.float64[:](nb.float64[:, :]), nb.float32[:](nb.float32[:, :])],
+        nopython=True)
+def _app_entropy(data):
+    """ Utility function which computes the Approximate Entropy (see
+    `compute_app_entropy`), compiled with Numba.
+
+    Parameters
+    ----------
+    data : shape (n_channels, n_times)
+
+    Returns
+    -------
+    output : ndarray, shape (n_channels)
+    """
     n_channels, n_times = data.shape
     appen = np.empty((n_channels,), dtype=data.dtype)
     for t in range(n_channels):
@@ -302,8 +456,43 @@ def compute_app_entropy(data):
     return appen
 
 
-@nb.jit([nb.float64[:](nb.float64[:, :]), nb.float32[:](nb.float32[:, :])],
-        nopython=True)
+def _app_entropy_numpy(data):
+    """ Vectorized (NumPy) version of `_app_entropy` (used if Numba is not
+    available).
+
+    The pairs of times (i, j), with i < j, are scanned by delay (j - i)
+    rather than by row: for each delay, the comparisons are vectorized over
+    the times and the channels.
+
+    Parameters
+    ----------
+    data : shape (n_channels, n_times)
+
+    Returns
+    -------
+    output : ndarray, shape (n_channels)
+    """
+    n_channels, n_times = data.shape
+    r = 0.25 * np.sqrt(np.sum(data ** 2, axis=-1) / (n_times - 1))[:, None]
+    # Number of the pairs (i, j) which match for (2 and 3) consecutive
+    # samples, for each value of i
+    a = np.zeros((n_channels, n_times - 2))
+    b = np.zeros((n_channels, n_times - 2))
+    for delay in range(1, n_times - 3):
+        n = n_times - 3 - delay
+        d = [np.abs(data[:, k:(k + n)] - data[:, (k + delay):(k + delay + n)])
+             for k in range(3)]
+        match = np.maximum(d[0], d[1]) < r
+        a[:, :n] += match
+        b[:, :n] += np.logical_and(match, d[2] < r)
+    a = np.cumsum(a, axis=-1)
+    b = np.cumsum(b, axis=-1)
+    valid = np.logical_and(a > 0, b > 0)
+    p = np.sum(np.log(np.where(valid, b, 1.) / np.where(valid, a, 1.)),
+               axis=-1)
+    return ((-2.0) * p / (n_times - 2)).astype(data.dtype)
+
+
 def compute_samp_entropy(data):
     """ Sample Entropy (SampEn, per channel) [1].
 
@@ -321,6 +510,26 @@ def compute_samp_entropy(data):
            studies on the prediction of epileptic seizures. Journal of
            Neuroscience Methods, 200(2), 257-271.
     """
+    if has_numba:
+        return _samp_entropy(data)
+    else:
+        return _samp_entropy_numpy(data)
+
+
+@nb.jit([nb.float64[:](nb.float64[:, :]), nb.float32[:](nb.float32[:, :])],
+        nopython=True)
+def _samp_entropy(data):
+    """ Utility function which computes the Sample Entropy (see
+    `compute_samp_entropy`), compiled with Numba.
+
+    Parameters
+    ----------
+    data : shape (n_channels, n_times)
+
+    Returns
+    -------
+    output : ndarray, shape (n_channels)
+    """
     n_channels, n_times = data.shape
     sampen = np.empty((n_channels,), dtype=data.dtype)
     for t in range(n_channels):
@@ -361,6 +570,40 @@ def compute_samp_entropy(data):
     return sampen
 
 
+def _samp_entropy_numpy(data):
+    """ Vectorized (NumPy) version of `_samp_entropy` (used if Numba is not
+    available).
+
+    The pairs of times (i, j), with i < j, are scanned by delay (j - i): for
+    each delay, the matches of 2 (resp. 3) consecutive samples are obtained
+    from the matches of single samples, for all the times and the channels
+    at once.
+
+    Parameters
+    ----------
+    data : shape (n_channels, n_times)
+
+    Returns
+    -------
+    output : ndarray, shape (n_channels)
+    """
+    n_channels, n_times = data.shape
+    m = np.mean(data, axis=-1)[:, None]
+    s = np.sqrt(np.mean(data ** 2, axis=-1))[:, None]
+    x = (data - m) / s
+    r = 0.2
+    a = np.zeros((n_channels,))
+    b = np.zeros((n_channels,))
+    for delay in range(1, n_times):
+        match = np.abs(x[:, delay:] - x[:, :-delay]) < r
+        match2 = np.logical_and(match[:, 1:], match[:, :-1])
+        match3 = np.logical_and(match2[:, 1:], match[:, :-2])
+        a += np.sum(match3, axis=-1)
+        # The last pair of times (j = n_times - 1) is not counted in `b`
+        b += np.sum(match2[:, :-1], axis=-1)
+    return (-np.log(a / b)).astype(data.dtype)
+
+
 def compute_decorr_time(sfreq, data):
     """ Decorrelation time (per channel) [1].
 
@@ -370,10 +613,14 @@ def compute_decorr_time(sfreq, data):
         Sampling rate of the data.
 
     data : ndarray, shape (n_channels, n_times)
+        The decorrelation times can also be computed for a batch of epochs
+        at once, by passing data of shape (n_epochs, n_channels, n_times).
 
     Returns
     -------
     output : ndarray, shape (n_channels,)
+        Or (n_epochs, n_channels) if `data` is a batch of epochs. If the
+        autocorrelation of a channel has no zero crossing, -1 is returned.
 
     References
     ----------
@@ -381,24 +628,18 @@ def compute_decorr_time(sfreq, data):
            studies on the prediction of epileptic seizures. Journal of
            Neuroscience Methods, 200(2), 257-271.
     """
-    n_channels, n_times = data.shape
-    decorrelation_times = np.empty((n_channels,))
-    for j in range(n_channels):
-        ac_channel = _unbiased_autocorr(data[j, :])
-        zero_cross = ac_channel[(n_times - 1):] <= 0
-        if np.any(zero_cross):
-            decorr_time = np.argmax(zero_cross)
-            decorr_time /= sfreq
-        else:
-            decorr_time = -1
-        decorrelation_times[j] = decorr_time
+    ac = _unbiased_autocorr(data)
+    zero_cross = ac <= 0
+    decorrelation_times = np.argmax(zero_cross, axis=-1) / sfreq
+    decorrelation_times[~np.any(zero_cross, axis=-1)] = -1
     return decorrelation_times
 
 
 def compute_power_spectrum_freq_bands(sfreq, data,
                                       freq_bands=np.array([0.5, 4., 8., 13.,
                                                            30., 100.]),
-                                      normalize=True):
+                                      normalize=True, psd_method='fft',
+                                      psd_params=None):
     """ Power Spectrum (computed by frequency bands) [1].
 
     Parameters
@@ -407,6 +648,8 @@ def compute_power_spectrum_freq_bands(sfreq, data,
         Sampling rate of the data.
 
     data : ndarray, shape (n_channels, n_times)
+        The features can also be computed for a batch of epochs at once, by
+        passing data of shape (n_epochs, n_channels, n_times).
 
     freq_bands : ndarray, shape (n_freqs,)
         (default: np.array([0.5, 4., 8., 13., 30., 100.]))
@@ -417,9 +660,19 @@ def compute_power_spectrum_freq_bands(sfreq, data,
         If True, the average power in each frequency band is normalized by
         the total power.
 
+    psd_method : str (default: 'fft')
+        Method used for the estimation of the Power Spectrum: 'fft', 'welch'
+        or 'multitaper' (see `utils.power_spectrum`).
+
+    psd_params : dict or None (default: None)
+        If not None, dict of parameters of the PSD estimation method (see
+        `utils.power_spectrum`).
+
     Returns
     -------
     output : ndarray, shape (n_channels * (n_freqs - 1),)
+        If `data` is a batch of epochs, the shape of the output is
+        (n_epochs, n_channels * (n_freqs - 1)).
 
     References
     ----------
@@ -427,21 +680,19 @@ def compute_power_spectrum_freq_bands(sfreq, data,
            studies on the prediction of epileptic seizures. Journal of
            Neuroscience Methods, 200(2), 257-271.
     """
-    n_channels = data.shape[0]
-    n_freqs = freq_bands.shape[0]
-    ps, freqs = power_spectrum(sfreq, data, return_db=False)
-    idx_freq_bands = np.digitize(freqs, freq_bands)
-    pow_freq_bands = np.empty((n_channels, n_freqs - 1))
-    for j in range(1, n_freqs):
-        ps_band = ps[:, idx_freq_bands == j]
-        pow_freq_bands[:, j - 1] = np.sum(ps_band, axis=-1)
+    ps, freqs = power_spectrum(sfreq, data, return_db=False,
+                               psd_method=psd_method, psd_params=psd_params)
+    n_fft = int(round(sfreq / freqs[1]))
+    bands = _freq_bands_matrix(float(sfreq), n_fft,
+                               tuple(np.asarray(freq_bands, float).tolist()))
+    pow_freq_bands = np.dot(ps, bands)
     if normalize:
-        pow_freq_bands = np.divide(pow_freq_bands,
-                                   np.sum(ps, axis=-1)[:, None])
-    return pow_freq_bands.ravel()
+        pow_freq_bands /= np.sum(ps, axis=-1)[..., None]
+    return pow_freq_bands.reshape(data.shape[:-2] + (-1,))
 
 
-def compute_spect_hjorth_mobility(sfreq, data, normalize=False):
+def compute_spect_hjorth_mobility(sfreq, data, normalize=False,
+                                  psd_method='fft', psd_params=None):
     """ Hjorth mobility (computed from the power spectrum, per channel) [1].
 
     Parameters
@@ -454,6 +705,14 @@ def compute_spect_hjorth_mobility(sfreq, data, normalize=False):
     normalize : bool (default: False)
         Normalize the result by the total power (see [2]).
 
+    psd_method : str (default: 'fft')
+        Method used for the estimation of the Power Spectrum: 'fft', 'welch'
+        or 'multitaper' (see `utils.power_spectrum`).
+
+    psd_params : dict or None (default: None)
+        If not None, dict of parameters of the PSD estimation method (see
+        `utils.power_spectrum`).
+
     Returns
     -------
     output : ndarray, shape (n_channels,)
@@ -467,7 +726,8 @@ def compute_spect_hjorth_mobility(sfreq, data, normalize=False):
            studies on the prediction of epileptic seizures. Journal of
            Neuroscience Methods, 200(2), 257-271.
     """
-    ps, freqs = power_spectrum(sfreq, data)
+    ps, freqs = power_spectrum(sfreq, data, psd_method=psd_method,
+                               psd_params=psd_params)
     w_freqs = np.power(freqs, 2)
     mobility = np.sum(np.multiply(ps, w_freqs), axis=-1)
     if normalize:
@@ -475,7 +735,8 @@ def compute_spect_hjorth_mobility(sfreq, data, normalize=False):
     return mobility
 
 
-def compute_spect_hjorth_complexity(sfreq, data, normalize=False):
+def compute_spect_hjorth_complexity(sfreq, data, normalize=False,
+                                    psd_method='fft', psd_params=None):
     """ Hjorth complexity (computed from the power spectrum, per channel) [1].
 
     Parameters
@@ -488,6 +749,14 @@ def compute_spect_hjorth_complexity(sfreq, data, normalize=False):
     normalize : bool (default: False)
         Normalize the result by the total power (see [2]).
 
+    psd_method : str (default: 'fft')
+        Method used for the estimation of the Power Spectrum: 'fft', 'welch'
+        or 'multitaper' (see `utils.power_spectrum`).
+
+    psd_params : dict or None (default: None)
+        If not None, dict of parameters of the PSD estimation method (see
+        `utils.power_spectrum`).
+
     Returns
     -------
     output : ndarray, shape (n_channels,)
@@ -501,7 +770,8 @@ def compute_spect_hjorth_complexity(sfreq, data, normalize=False):
            studies on the prediction of epileptic seizures. Journal of
            Neuroscience Methods, 200(2), 257-271.
     """
-    ps, freqs = power_spectrum(sfreq, data)
+    ps, freqs = power_spectrum(sfreq, data, psd_method=psd_method,
+                               psd_params=psd_params)
     w_freqs = np.power(freqs, 4)
     complexity = np.sum(np.multiply(ps, w_freqs), axis=-1)
     if normalize:
@@ -509,6 +779,74 @@ def compute_spect_hjorth_complexity(sfreq, data, normalize=False):
     return complexity
 
 
+def _var_with_zero(x):
+    """ Utility function which returns the (unbiased) variance of x and the
+    (unbiased) variance of x with a zero prepended (without copying x).
+
+    Parameters
+    ----------
+    x : ndarray, shape (n_channels, n_times)
+
+    Returns
+    -------
+    var : ndarray, shape (n_channels,)
+
+    var_zero : ndarray, shape (n_channels,)
+    """
+    n_times = x.shape[-1]
+    m = np.mean(x, axis=-1)
+    var = np.var(x, axis=-1, ddof=1)
+    var_zero = ((n_times - 1) * var +
+                n_times * m ** 2 / (n_times + 1)) / n_times
+    return var, var_zero
+
+
+@memoize_epoch
+def _hjorth_variances(data):
+    """ Variances of the signal and of its first and second differences,
+    which are used to compute the Hjorth mobility and complexity (time
+    domain). The differences are computed once per epoch and shared by
+    `compute_hjorth_mobility` and `compute_hjorth_complexity`.
+
+    As in [1], the first value of the signal (resp. its first difference) is
+    used as the first value of its first (resp. second) difference.
+
+    Parameters
+    ----------
+    data : ndarray, shape (n_channels, n_times)
+
+    Returns
+    -------
+    var_x : ndarray, shape (n_channels,)
+        Variance of the signal (with a zero prepended).
+
+    var_dx : ndarray, shape (n_channels,)
+        Variance of the first difference.
+
+    var_dx_zero : ndarray, shape (n_channels,)
+        Variance of the first difference (with a zero prepended).
+
+    var_ddx : ndarray, shape (n_channels,)
+        Variance of the second difference.
+
+    References
+    ----------
+    .. [1] Paivinen, N. et al. (2005). Epileptic seizure detection: A nonlinear
+           viewpoint. Computer methods and programs in biomedicine, 79(2),
+           151-159.
+    """
+    dx = np.empty_like(data)
+    dx[:, 0] = data[:, 0]
+    np.subtract(data[:, 1:], data[:, :-1], out=dx[:, 1:])
+    ddx = np.empty_like(data)
+    ddx[:, 0] = dx[:, 0]
+    np.subtract(dx[:, 1:], dx[:, :-1], out=ddx[:, 1:])
+    var_x = _var_with_zero(data)[1]
+    var_dx, var_dx_zero = _var_with_zero(dx)
+    var_ddx = np.var(ddx, axis=-1, ddof=1)
+    return var_x, var_dx, var_dx_zero, var_ddx
+
+
 def compute_hjorth_mobility(data):
     """ Hjorth mobility (computed in the time domain, per channel) [1].
 
@@ -526,12 +864,8 @@ def compute_hjorth_mobility(data):
            viewpoint. Computer methods and programs in biomedicine, 79(2),
            151-159.
     """
-    x = np.insert(data, 0, 0, axis=-1)
-    dx = np.diff(x, axis=-1)
-    sx = np.std(x, ddof=1, axis=-1)
-    sdx = np.std(dx, ddof=1, axis=-1)
-    mobility = np.divide(sdx, sx)
-    return mobility
+    var_x, var_dx, _, _ = _hjorth_variances(data)
+    return np.sqrt(np.divide(var_dx, var_x))
 
 
 def compute_hjorth_complexity(data):
@@ -551,16 +885,41 @@ def compute_hjorth_complexity(data):
            viewpoint. Computer methods and programs in biomedicine, 79(2),
            151-159.
     """
-    x = np.insert(data, 0, 0, axis=-1)
-    dx = np.diff(x, axis=-1)
-    m_dx = compute_hjorth_mobility(dx)
-    m_x = compute_hjorth_mobility(data)
-    complexity = np.divide(m_dx, m_x)
-    return complexity
+    var_x, var_dx, var_dx_zero, var_ddx = _hjorth_variances(data)
+    return np.sqrt(np.divide(var_ddx * var_x, var_dx_zero * var_dx))
+
+
+def _higuchi_curve_lengths(data, k):
+    """ Utility function which returns the normalized curve lengths used in
+    the computation of the Higuchi Fractal Dimension, for all the offsets
+    `m` (0 <= m <= k - 1) of a given delay `k`.
+
+    Parameters
+    ----------
+    data : ndarray, shape (n_channels, n_times)
+
+    k : int
+        Delay (in number of samples).
+
+    Returns
+    -------
+    output : ndarray, shape (n_channels, k)
+    """
+    n_channels, n_times = data.shape
+    # For the offset m, the curve length is the sum of the absolute
+    # differences |x[m + j * k] - x[m + (j - 1) * k]| (1 <= j <= n_max - 1),
+    # i.e. the sum of the k-strided differences whose index is congruent to
+    # m (modulo k), excluding the last one. These last differences are the k
+    # last ones, which are dropped before summing by residue class.
+    dists = np.abs(data[:, k:] - data[:, :-k])[:, :max(n_times - 2 * k, 0)]
+    n_rows = -(-dists.shape[-1] // k)
+    _dists = np.zeros((n_channels, n_rows * k), dtype=dists.dtype)
+    _dists[:, :dists.shape[-1]] = dists
+    ll = np.sum(_dists.reshape(n_channels, n_rows, k), axis=1)
+    n_max = (n_times - np.arange(k) - 1) // k
+    return ll * (n_times - 1) / (k * k * n_max)
 
 
-@nb.jit([nb.float64[:](nb.float64[:, :], nb.optional(nb.int64)),
-         nb.float32[:](nb.float32[:, :], nb.optional(nb.int32))])
 def compute_higuchi_fd(data, kmax=10):
     """ Higuchi Fractal Dimension (per channel) [1, 2].
 
@@ -585,33 +944,16 @@ def compute_higuchi_fd(data, kmax=10):
            viewpoint. Computer methods and programs in biomedicine, 79(2),
            151-159.
     """
-    n_channels, n_times = data.shape
-    higuchi = np.empty((n_channels,), dtype=data.dtype)
-    for s in range(n_channels):
-        lk = np.empty((kmax,))
-        x_reg = np.empty((kmax,))
-        y_reg = np.empty((kmax,))
-        for k in range(1, kmax + 1):
-            lm = np.empty((k,))
-            for m in range(k):
-                ll = 0
-                n_max = floor((n_times - m - 1) / k)
-                n_max = int(n_max)
-                for j in range(1, n_max):
-                    ll += abs(data[s, m + j * k] - data[s, m + (j - 1) * k])
-                ll /= k
-                ll *= (n_times - 1) / (k * n_max)
-                lm[m] = ll
-            # Mean of lm
-            m_lm = 0
-            for m in range(k):
-                m_lm += lm[m]
-            m_lm /= k
-            lk[k - 1] = m_lm
-            x_reg[k - 1] = log(1. / k)
-            y_reg[k - 1] = log(m_lm)
-        higuchi[s] = _slope_lstsq(x_reg, y_reg)
-    return higuchi
+    n_channels = data.shape[0]
+    y_reg = np.empty((n_channels, kmax))
+    for k in range(1, kmax + 1):
+        y_reg[:, k - 1] = np.log(np.mean(_higuchi_curve_lengths(data, k),
+                                         axis=-1))
+    x_reg = np.log(1. / np.arange(1, kmax + 1))
+    x_reg -= np.mean(x_reg)
+    y_reg -= np.mean(y_reg, axis=-1)[:, None]
+    higuchi = np.dot(y_reg, x_reg) / np.dot(x_reg, x_reg)
+    return higuchi.astype(data.dtype)
 
 
 def compute_katz_fd(data):
@@ -676,7 +1018,7 @@ def compute_line_length(data):
     return np.sum(np.abs(np.diff(data, axis=-1)), axis=-1)
 
 
-def compute_spect_entropy(sfreq, data):
+def compute_spect_entropy(sfreq, data, psd_method='fft', psd_params=None):
     """ Spectral Entropy (Shannon entropy of the power spectrum,
     per channel) [1].
 
@@ -687,6 +1029,14 @@ def compute_spect_entropy(sfreq, data):
 
     data : ndarray, shape (n_channels, n_times)
 
+    psd_method : str (default: 'fft')
+        Method used for the estimation of the Power Spectrum: 'fft', 'welch'
+        or 'multitaper' (see `utils.power_spectrum`).
+
+    psd_params : dict or None (default: None)
+        If not None, dict of parameters of the PSD estimation method (see
+        `utils.power_spectrum`).
+
     Returns
     -------
     output : ndarray, shape (n_channels,)
@@ -697,7 +1047,8 @@ def compute_spect_entropy(sfreq, data):
            use of the entropy of the power spectrum. Electroencephalography
            and clinical neurophysiology, 79(3), 204-210.
     """
-    ps, _ = power_spectrum(sfreq, data, return_db=False)
+    ps, _ = power_spectrum(sfreq, data, return_db=False,
+                           psd_method=psd_method, psd_params=psd_params)
     m = np.sum(ps, axis=-1)
     ps_norm = np.divide(ps[:, 1:], m[:, None])
     return -np.sum(np.multiply(ps_norm, np.log2(ps_norm)), axis=-1)
@@ -726,9 +1077,7 @@ def compute_svd_entropy(data, tau=2, emb=10):
            electroencephalogram based brain-computer interfacing. Medical &
            biological engineering & computing, 37(1), 93-98.
     """
-    _, sv, _ = np.linalg.svd(embed(data, d=emb, tau=tau))
-    m = np.sum(sv, axis=-1)
-    sv_norm = np.divide(sv, m[:, None])
+    sv_norm = _svd_spectrum(data, tau, emb)
     return -np.sum(np.multiply(sv_norm, np.log2(sv_norm)), axis=-1)
 
 
@@ -755,9 +1104,7 @@ def compute_svd_fisher_info(data, tau=2, emb=10):
            electroencephalogram based brain-computer interfacing. Medical &
            biological engineering & computing, 37(1), 93-98.
     """
-    _, sv, _ = np.linalg.svd(embed(data, d=emb, tau=tau))
-    m = np.sum(sv, axis=-1)
-    sv_norm = np.divide(sv, m[:, None])
+    sv_norm = _svd_spectrum(data, tau, emb)
     aux = np.divide(np.diff(sv_norm, axis=-1) ** 2, sv_norm[:, :-1])
     return np.sum(aux, axis=-1)
 
@@ -793,20 +1140,17 @@ def compute_energy_freq_bands(sfreq, data, freq_bands=np.array([0.5, 4., 8.,
     .. [1] Kharbouch, A. et al. (2011). An algorithm for seizure onset
            detection using intracranial EEG. Epilepsy & Behavior, 22, S29-S35.
     """
-    n_freqs = freq_bands.shape[0]
-    n_channels = data.shape[0]
-    band_energy = np.empty((n_channels, n_freqs - 1))
     if deriv_filt:
         _data = convolve1d(data, [1., 0., -1.], axis=-1, mode='nearest')
     else:
         _data = data
-    for j in range(1, n_freqs):
-        filtered_data = filt(sfreq, _data, freq_bands[(j - 1):(j + 1)])
-        band_energy[:, j - 1] = np.sum(filtered_data ** 2, axis=-1)
-    return band_energy.ravel()
+    filtered_data = filt_bands(sfreq, _data, freq_bands)
+    band_energy = np.sum(filtered_data ** 2, axis=-1)
+    return band_energy.T.ravel()
 
 
-def compute_spect_edge_freq(sfreq, data, ref_freq=None, edge=None):
+def compute_spect_edge_freq(sfreq, data, ref_freq=None, edge=None,
+                            psd_method='fft', psd_params=None):
     """ Spectal Edge Frequency (per channel) [1].
 
     Parameters
@@ -815,6 +1159,8 @@ def compute_spect_edge_freq(sfreq, data, ref_freq=None, edge=None):
         Sampling rate of the data.
 
     data : ndarray, shape (n_channels, n_times)
+        The features can also be computed for a batch of epochs at once, by
+        passing data of shape (n_epochs, n_channels, n_times).
 
     ref_freq : float or None (default: None)
         If not None, reference frequency for the computation of the spectral
@@ -827,10 +1173,20 @@ def compute_spect_edge_freq(sfreq, data, ref_freq=None, edge=None):
         computed for each different value in `edge`. If None, `edge = [0.5]`
         is used.
 
+    psd_method : str (default: 'fft')
+        Method used for the estimation of the Power Spectrum: 'fft', 'welch'
+        or 'multitaper' (see `utils.power_spectrum`).
+
+    psd_params : dict or None (default: None)
+        If not None, dict of parameters of the PSD estimation method (see
+        `utils.power_spectrum`).
+
     Returns
     -------
     output : ndarray, shape (n_channels * n_edge,)
         With: `n_edge = 1` if `edge` is None or `n_edge = len(edge)` otherwise.
+        If `data` is a batch of epochs, the shape of the output is
+        (n_epochs, n_channels * n_edge).
 
     References
     ----------
@@ -845,21 +1201,49 @@ def compute_spect_edge_freq(sfreq, data, ref_freq=None, edge=None):
         _edge = [0.5]
     else:
         _edge = [e / 100. for e in edge]
-    n_edge = len(_edge)
-    n_channels, n_times = data.shape
-    spect_edge_freq = np.empty((n_channels, n_edge))
-    ps, freqs = power_spectrum(sfreq, data, return_db=False)
-    out = np.cumsum(ps, 1)
+    ps, freqs = power_spectrum(sfreq, data, return_db=False,
+                               psd_method=psd_method, psd_params=psd_params)
+    out = np.cumsum(ps, axis=-1)
+    idx_ref = np.where(freqs >= _ref_freq)[0][0]
+    ref_pow = out[..., idx_ref]
+    # As the cumulative power is non-decreasing, the index of the first
+    # frequency bin where it reaches the threshold is the number of bins
+    # where it is below the threshold (-1 is returned if it is never
+    # reached).
+    _freqs = np.r_[freqs, -1]
+    spect_edge_freq = np.empty(data.shape[:-1] + (len(_edge),))
     for i, p in enumerate(_edge):
-        idx_ref = np.where(freqs >= _ref_freq)[0][0]
-        ref_pow = np.sum(ps[:, :(idx_ref + 1)], axis=-1)
-        for j in range(n_channels):
-            idx = np.where(out[j, :] >= p * ref_pow[j])[0]
-            if idx.size > 0:
-                spect_edge_freq[j, i] = freqs[idx[0]]
-            else:
-                spect_edge_freq[j, i] = -1
-    return spect_edge_freq.ravel()
+        idx = np.sum(out < p * ref_pow[..., None], axis=-1)
+        spect_edge_freq[..., i] = _freqs[idx]
+    return spect_edge_freq.reshape(data.shape[:-2] + (-1,))
+
+
+@_lru_cache(maxsize=32)
+def _get_wavelet(wavelet_name, n_times):
+    """ Utility function which returns the Wavelet object and the
+    decomposition level to be used for the DWT of signals with `n_times` time
+    points. Both are cached for the 32 most recently used pairs
+    `(wavelet_name, n_times)`.
+
+    Parameters
+    ----------
+    wavelet_name : str
+        Wavelet name (to be used with `pywt.Wavelet`).
+
+    n_times : int
+        Number of time points.
+
+    Returns
+    -------
+    wavelet : instance of `pywt.Wavelet`
+
+    levdec : int
+        Decomposition level: either 6 or the maximum useful decomposition
+        level (see `pywt.dwt_max_level`).
+    """
+    wavelet = pywt.Wavelet(wavelet_name)
+    levdec = min(pywt.dwt_max_level(n_times, wavelet.dec_len), 6)
+    return wavelet, levdec
 
 
 def compute_wavelet_coef_energy(data, wavelet_name='db4'):
@@ -868,6 +1252,8 @@ def compute_wavelet_coef_energy(data, wavelet_name='db4'):
     Parameters
     ----------
     data : ndarray, shape (n_channels, n_times)
+        The features can also be computed for a batch of epochs at once, by
+        passing data of shape (n_epochs, n_channels, n_times).
 
     wavelet_name : str (default: db4)
         Wavelet name (to be used with `pywt.Wavelet`). The full list of Wavelet
@@ -879,7 +1265,9 @@ def compute_wavelet_coef_energy(data, wavelet_name='db4'):
     output : ndarray, shape (n_channels * levdec,)
         The decomposition level (`levdec`) used for the DWT is either 6 or
         the maximum useful decomposition level (given the number of time points
-        in the data and chosen wavelet ; see `pywt.dwt_max_level`).
+        in the data and chosen wavelet ; see `pywt.dwt_max_level`). If `data`
+        is a batch of epochs, the shape of the output is
+        (n_epochs, n_channels * levdec).
 
     References
     ----------
@@ -887,12 +1275,11 @@ def compute_wavelet_coef_energy(data, wavelet_name='db4'):
            studies on the prediction of epileptic seizures. Journal of
            Neuroscience Methods, 200(2), 257-271.
     """
-    n_channels, n_times = data.shape
-    wavelet = pywt.Wavelet(wavelet_name)
-    levdec = min(pywt.dwt_max_level(n_times, wavelet.dec_len), 6)
-    wavelet_energy = np.zeros((n_channels, levdec))
-    for j in range(n_channels):
-        coefs = pywt.wavedec(data[j, :], wavelet, level=levdec)
-        for l in range(levdec):
-            wavelet_energy[j, l] = np.sum(coefs[levdec - l] ** 2)
-    return wavelet_energy.ravel()
+    wavelet, levdec = _get_wavelet(wavelet_name, data.shape[-1])
+    coefs = pywt.wavedec(data, wavelet, level=levdec, axis=-1)
+    # Detail coefficients, from level 1 to level `levdec`
+    details = coefs[:0:-1]
+    idx = np.cumsum([0] + [c.shape[-1] for c in details[:-1]])
+    wavelet_energy = np.add.reduceat(np.concatenate(details, axis=-1) ** 2,
+                                     idx, axis=-1)
+    return wavelet_energy.reshape(data.shape[:-2] + (-1,))
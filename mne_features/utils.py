@@ -6,11 +6,19 @@
 """ Utility functions to be used with either univariate or bivariate feature
 functions."""
 
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 from math import floor
+from threading import local
 from warnings import warn
 
 import numpy as np
-from mne.filter import filter_data
+from numpy.lib.stride_tricks import as_strided
+from mne.filter import create_filter
+from mne.time_frequency import psd_array_multitaper
+from scipy.fftpack import next_fast_len
+from scipy.signal import welch
 
 from .mock_numba import nb
 
@@ -35,6 +43,140 @@ def triu_idx(n):
             yield pos, i, j
 
 
+def pairs_idx(n_channels, pairs=None):
+    """ Utility function which returns the indices (i, j) of the pairs of
+    channels for which a bivariate feature is computed.
+
+    Parameters
+    ----------
+    n_channels : int
+
+    pairs : array-like or None (default: None)
+        Either a list of pairs of channel indices, of shape (n_pairs, 2), or
+        a boolean adjacency matrix of shape (n_channels, n_channels). In the
+        latter case, the pairs are the nonzero entries of the upper
+        triangular part (diagonal included) of the matrix. If None, all the
+        pairs (i, j) with i <= j are used (same order as `triu_idx`).
+
+    Returns
+    -------
+    rows : ndarray, shape (n_pairs,)
+
+    cols : ndarray, shape (n_pairs,)
+    """
+    if pairs is None:
+        return np.triu_indices(n_channels)
+    _pairs = np.asarray(pairs)
+    if _pairs.dtype == bool:
+        if _pairs.shape != (n_channels, n_channels):
+            raise ValueError('The adjacency matrix should be of shape '
+                             '(%d, %d). Got %s.' % (n_channels, n_channels,
+                                                    _pairs.shape))
+        return np.nonzero(np.triu(_pairs))
+    if _pairs.ndim != 2 or _pairs.shape[1] != 2:
+        raise ValueError('The pairs of channels should be given as an array '
+                         'of shape (n_pairs, 2). Got %s.' % (_pairs.shape,))
+    _pairs = _pairs.astype(int)
+    if np.any(_pairs < 0) or np.any(_pairs >= n_channels):
+        raise ValueError('The channel indices in `pairs` should be between '
+                         '0 and %d.' % (n_channels - 1))
+    return _pairs[:, 0], _pairs[:, 1]
+
+
+_cache_state = local()
+
+
+@contextmanager
+def epoch_cache():
+    """ Context manager which opens a cache for the functions decorated with
+    `memoize_epoch`, for the duration of the extraction of the features of
+    one epoch. The cache (and the outputs it holds) is cleared on exit.
+
+    Feature functions which depend on the same intermediate quantity (for
+    instance, the singular values of the embedded data) can then share it
+    when they are applied to the same epoch: the intermediate is computed
+    only once. The epoch should not be modified while the cache is open.
+    """
+    previous = getattr(_cache_state, 'cache', None)
+    _cache_state.cache = dict()
+    try:
+        yield
+    finally:
+        _cache_state.cache = previous
+
+
+def _set_read_only(out):
+    """ Utility function which makes an array (or the arrays of a tuple)
+    read-only. The other objects are left unchanged.
+
+    Parameters
+    ----------
+    out : ndarray, tuple or object
+    """
+    for _out in (out if isinstance(out, tuple) else (out,)):
+        if isinstance(_out, np.ndarray):
+            _out.flags.writeable = False
+
+
+def cached_call(key, data, compute):
+    """ Utility function which returns `compute()`, cached for the array
+    `data` and the hashable key `key` if an epoch cache is open (see
+    `epoch_cache`). The cached arrays are read-only, as they are shared by
+    several callers. If no epoch cache is open, or if `key` is not hashable
+    (for instance, if it holds an array of parameters), `compute()` is
+    returned.
+
+    Parameters
+    ----------
+    key : hashable
+
+    data : ndarray
+
+    compute : callable
+        Function without argument which computes the value to cache.
+
+    Returns
+    -------
+    output : output of `compute`
+    """
+    cache = getattr(_cache_state, 'cache', None)
+    if cache is None:
+        return compute()
+    _key = (key, id(data))
+    try:
+        hash(_key)
+    except TypeError:
+        return compute()
+    if _key not in cache:
+        out = compute()
+        _set_read_only(out)
+        # The data is held by the cache, so that its id cannot be reused by
+        # another array while the cache is open
+        cache[_key] = (data, out)
+    return cache[_key][1]
+
+
+def memoize_epoch(func):
+    """ Decorator which caches the output of a function of a data array (and
+    optional parameters) within an epoch cache (see `epoch_cache`). Outside
+    of an epoch cache, the function is called as usual.
+
+    Parameters
+    ----------
+    func : callable
+        Function with signature `func(data, *args)`. The output is only
+        cached if the values of `args` are hashable.
+
+    Returns
+    -------
+    callable
+    """
+    @wraps(func)
+    def wrapper(data, *args):
+        return cached_call((func, args), data, lambda: func(data, *args))
+    return wrapper
+
+
 def embed(x, d, tau):
     """ Utility function to compute the time-delay embedding of a [univariate
     or multivariate] time series x.
@@ -55,38 +197,232 @@ def embed(x, d, tau):
     Returns
     -------
     output : ndarray, shape (n_channels, n_times - 1 - (d - 1) * tau, d)
+        The output is a read-only view on `x` (no data is copied).
     """
     n_times = x.shape[-1]
-    ndim = x.ndim
     tau_max = floor((n_times - 1) / (d - 1))
     if tau > tau_max:
         warn('The given value (%s) for the parameter `tau` exceeds '
              '`tau_max = floor((n_times - 1) / (d - 1))`. Using `tau_max` '
              'instead.' % tau)
         tau = tau_max
-    idx = tau * np.arange(d)
-    return np.concatenate([x[..., None, j + idx] for j in
-                           range(n_times - 1 - (d - 1) * tau)], axis=ndim - 1)
+    n_vectors = n_times - 1 - (d - 1) * tau
+    shape = x.shape[:-1] + (n_vectors, d)
+    strides = x.strides[:-1] + (x.strides[-1], tau * x.strides[-1])
+    # The `writeable` parameter of `as_strided` requires numpy >= 1.12
+    out = as_strided(x, shape=shape, strides=strides)
+    out.flags.writeable = False
+    return out
+
+
+def _lru_cache(maxsize):
+    """ Decorator which caches the outputs of a function of hashable
+    (positional) arguments. Only the outputs of the `maxsize` most recently
+    used arguments are kept (as with `functools.lru_cache`, which is not
+    available in Python 2).
 
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of cached outputs.
+
+    Returns
+    -------
+    callable
+    """
+    def decorator(func):
+        cache = OrderedDict()
+
+        @wraps(func)
+        def wrapper(*args):
+            if args in cache:
+                # Move the entry to the end (most recently used)
+                out = cache.pop(args)
+            else:
+                out = func(*args)
+                if len(cache) >= maxsize:
+                    # Evict the least recently used entry
+                    cache.popitem(last=False)
+            cache[args] = out
+            return out
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+@_lru_cache(maxsize=32)
+def _freq_bands_matrix(sfreq, n_fft, freq_bands):
+    """ Utility function which returns the band-membership matrix of the
+    frequency bins of a (one sided) power spectrum computed with FFTs of
+    length `n_fft`. The matrix is computed once for each value of `sfreq`,
+    `n_fft` and `freq_bands` (the 32 most recently used matrices are
+    cached).
+
+    Parameters
+    ----------
+    sfreq : float
+        Sampling rate of the data.
+
+    n_fft : int
+        Length of the FFT used to compute the power spectrum.
+
+    freq_bands : tuple of float, shape (n_freqs,)
+        The j-th frequency band is defined as:
+        [freq_bands[j], freq_bands[j + 1]] (0 <= j <= n_freqs - 2).
+
+    Returns
+    -------
+    output : ndarray, shape (n_fft // 2 + 1, n_freqs - 1)
+        The entry (k, j) is 1 if the k-th frequency bin belongs to the j-th
+        frequency band and 0 otherwise.
+    """
+    freqs = np.fft.rfftfreq(n_fft, 1. / sfreq)
+    idx_freq_bands = np.digitize(freqs, freq_bands)
+    bands = np.equal.outer(idx_freq_bands,
+                           np.arange(1, len(freq_bands))).astype(float)
+    bands.flags.writeable = False
+    return bands
+
+
+_psd_params = {'fft': dict(),
+               'welch': {'n_per_seg': 256, 'n_overlap': None,
+                         'window': 'hann'},
+               'multitaper': {'bandwidth': None, 'adaptive': False,
+                              'low_bias': True}}
+
+
+def _check_psd_params(psd_method, psd_params):
+    """ Utility function to check the PSD estimation method and its
+    parameters.
+
+    Parameters
+    ----------
+    psd_method : str
+        PSD estimation method: 'fft', 'welch' or 'multitaper'.
+
+    psd_params : dict or None
+        Parameters of the PSD estimation method (see `power_spectrum`). If
+        None, the default parameters are used.
+
+    Returns
+    -------
+    output : tuple
+        Sorted items of the dictionary of parameters (default values
+        included).
+    """
+    if psd_method not in _psd_params:
+        raise ValueError('The given PSD estimation method (%s) is not valid. '
+                         'Valid methods are: %s.' %
+                         (psd_method, sorted(_psd_params.keys())))
+    params = _psd_params[psd_method].copy()
+    if psd_params is not None:
+        for key in psd_params:
+            if key not in params:
+                raise ValueError('Invalid parameter %s for the PSD estimation '
+                                 'method %s. Valid parameters are: %s.' %
+                                 (key, psd_method, sorted(params.keys())))
+        params.update(psd_params)
+    return tuple(sorted(params.items()))
+
+
+@memoize_epoch
+def _power_spectrum(data, sfreq, psd_method, psd_params):
+    """ Utility function to compute the [one sided] Power Spectrum, shared by
+    the spectral feature functions (see `power_spectrum`).
+
+    Parameters
+    ----------
+    data : ndarray, shape (n_channels, n_times)
+
+    sfreq : float
+        Sampling rate of the data.
+
+    psd_method : str
+        PSD estimation method: 'fft', 'welch' or 'multitaper'.
+
+    psd_params : tuple
+        Output of `_check_psd_params`.
+
+    Returns
+    -------
+    ps : ndarray, shape (n_channels, n_freqs)
 
-def power_spectrum(sfreq, data, return_db=False):
+    freqs : ndarray, shape (n_freqs,)
+    """
+    n_times = data.shape[-1]
+    params = dict(psd_params)
+    if psd_method == 'welch':
+        n_per_seg = min(params['n_per_seg'], n_times)
+        freqs, ps = welch(data, sfreq, window=params['window'],
+                          nperseg=n_per_seg, noverlap=params['n_overlap'],
+                          axis=-1)
+        ps *= sfreq / n_per_seg
+    elif psd_method == 'multitaper':
+        ps, freqs = psd_array_multitaper(
+            data, sfreq, bandwidth=params['bandwidth'],
+            adaptive=params['adaptive'], low_bias=params['low_bias'],
+            normalization='full', verbose=40)
+        ps *= sfreq / n_times
+    else:
+        m = np.mean(data, axis=-1)
+        _data = data - m[..., None]
+        spect = np.fft.rfft(_data, n_times)
+        mag = np.abs(spect)
+        freqs = np.fft.rfftfreq(n_times, 1. / sfreq)
+        ps = np.power(mag, 2) / (n_times ** 2)
+        ps *= 2.
+        ps[..., 0] /= 2.
+        if n_times % 2 == 0:
+            ps[..., -1] /= 2.
+    return ps, freqs
+
+
+def power_spectrum(sfreq, data, return_db=False, psd_method='fft',
+                   psd_params=None):
     """ Utility function to compute the [one sided] Power Spectrum [1, 2].
 
+    The power spectrum is estimated either with a single periodogram of the
+    data ('fft'), with Welch's method ('welch' [3]) or with the multitaper
+    method ('multitaper', see `mne.time_frequency.psd_array_multitaper`).
+    Whatever the method, the output is the power in each frequency bin (its
+    sum over frequencies is close to the variance of the data).
+
+    The power spectrum is computed once per epoch (for a given method and
+    parameters) and shared by the spectral feature functions.
+
     Parameters
     ----------
     sfreq : float
         Sampling rate of the data.
 
     data : ndarray, shape (n_channels, n_times)
+        The power spectrum can also be computed for a batch of epochs at
+        once, by passing data of shape (n_epochs, n_channels, n_times).
 
     return_db : bool (default: False)
         If True, the result is returned in dB/Hz.
 
+    psd_method : str (default: 'fft')
+        PSD estimation method: 'fft', 'welch' or 'multitaper'.
+
+    psd_params : dict or None (default: None)
+        If not None, dict of parameters of the PSD estimation method. Valid
+        keys are: 'n_per_seg' (default: 256), 'n_overlap' (default: None,
+        that is `n_per_seg // 2`) and 'window' (default: 'hann') if
+        `psd_method == 'welch'` ; 'bandwidth' (default: None), 'adaptive'
+        (default: False) and 'low_bias' (default: True) if
+        `psd_method == 'multitaper'`.
+
     Returns
     -------
-    ps : ndarray, shape (n_channels, n_times // 2 + 1)
-
-    freqs : ndarray, shape (n_channels, n_times // 2 + 1)
+    ps : ndarray, shape (..., n_channels, n_freqs)
+        With `n_freqs = n_times // 2 + 1` if `psd_method` is 'fft' or
+        'multitaper' and `n_freqs = n_per_seg // 2 + 1` if `psd_method` is
+        'welch'. Within an epoch cache (see `epoch_cache`), the output is
+        shared by the spectral feature functions and is read-only (unless
+        `return_db` is True).
+
+    freqs : ndarray, shape (n_freqs,)
         Array of frequency bins.
 
     References
@@ -97,18 +433,14 @@ def power_spectrum(sfreq, data, return_db=False):
 
     .. [2] http://fr.mathworks.com/help/signal/ug/power-spectral-density-
            estimates-using-fft.html
+
+    .. [3] Welch, P. (1967). The use of fast Fourier transform for the
+           estimation of power spectra: a method based on time averaging over
+           short, modified periodograms. IEEE Transactions on audio and
+           electroacoustics, 15(2), 70-73.
     """
-    n_times = data.shape[1]
-    m = np.mean(data, axis=-1)
-    _data = data - m[:, None]
-    spect = np.fft.rfft(_data, n_times)
-    mag = np.abs(spect)
-    freqs = np.fft.rfftfreq(n_times, 1. / sfreq)
-    ps = np.power(mag, 2) / (n_times ** 2)
-    ps *= 2.
-    ps[:, 0] /= 2.
-    if n_times % 2 == 0:
-        ps[:, -1] /= 2.
+    params = _check_psd_params(psd_method, psd_params)
+    ps, freqs = _power_spectrum(data, sfreq, psd_method, params)
     if return_db:
         return 10. * np.log10(ps), freqs
     else:
@@ -117,7 +449,12 @@ def power_spectrum(sfreq, data, return_db=False):
 
 def filt(sfreq, data, filter_freqs, verbose=False):
     """ Utility function to filter data.
-    Wrapper function for `mne.filter.filter_data` [1].
+
+    The data is filtered with a zero-phase FIR filter designed by
+    `mne.filter.create_filter` (with `fir_design='firwin'`), and padded as in
+    `mne.filter.filter_data` [1]. The designed filters are cached (see
+    `_get_filter_bank`), so that filtering many epochs with the same sampling
+    rate and cutoff frequencies only costs the FFT convolution.
 
     Parameters
     ----------
@@ -136,7 +473,7 @@ def filt(sfreq, data, filter_freqs, verbose=False):
 
     verbose : bool (default: False)
         Verbosity parameter. If True, info and warnings related to
-        `mne.filter.filter_data` are printed.
+        `mne.filter.create_filter` are printed (when the filter is designed).
 
     Returns
     -------
@@ -149,7 +486,179 @@ def filt(sfreq, data, filter_freqs, verbose=False):
     if filter_freqs[0] is None and filter_freqs[1] is None:
         raise ValueError('The values of `filter_freqs` cannot all be None.')
     else:
-        _verbose = 40 * (1 - int(verbose))
-        return filter_data(data, sfreq=sfreq, l_freq=filter_freqs[0],
-                           h_freq=filter_freqs[1], picks=None,
-                           fir_design='firwin', verbose=_verbose)
+        _filter_freqs = (tuple(_as_freq(f) for f in filter_freqs),)
+        bank = _get_filter_bank(sfreq, _filter_freqs, data.shape[-1],
+                                'firwin', verbose)
+        return _apply_filter_bank(data, bank)[0]
+
+
+def _reflect_pad(x, n_pad):
+    """ Utility function to pad the last axis of x (on both sides) with a
+    reflected version of x mirrored on its first and last values, followed
+    by zeros if `n_pad >= n_times` (same as the 'reflect_limited' padding of
+    `mne.filter.filter_data`).
+
+    Parameters
+    ----------
+    x : ndarray, shape (..., n_times)
+
+    n_pad : int
+        Number of samples added on each side.
+
+    Returns
+    -------
+    output : ndarray, shape (..., n_times + 2 * n_pad)
+    """
+    n_times = x.shape[-1]
+    n_refl = min(n_pad, n_times - 1)
+    output = np.zeros(x.shape[:-1] + (n_times + 2 * n_pad,), dtype=x.dtype)
+    output[..., n_pad:(n_pad + n_times)] = x
+    output[..., (n_pad - n_refl):n_pad] = (2 * x[..., :1] -
+                                           x[..., n_refl:0:-1])
+    output[..., (n_pad + n_times):(n_pad + n_times + n_refl)] = (
+        2 * x[..., -1:] - x[..., -2:(-n_refl - 2):-1])
+    return output
+
+
+def _as_freq(freq):
+    """ Utility function to convert a cutoff frequency to a hashable float
+    (or None).
+    """
+    return None if freq is None else float(freq)
+
+
+@_lru_cache(maxsize=32)
+def _get_filter_bank(sfreq, filters_freqs, n_times, fir_design='firwin',
+                     verbose=False):
+    """ Utility function which designs a bank of zero-phase FIR filters and
+    returns its frequency response.
+
+    The filters are designed with `mne.filter.create_filter`, as in
+    `mne.filter.filter_data`. They are zero-padded to a common (odd) length,
+    keeping them centered. The outputs of this function are cached for each
+    value of `sfreq`, `filters_freqs`, `n_times` and `fir_design` (at most
+    32 filter banks are kept, see `_lru_cache`).
+
+    Parameters
+    ----------
+    sfreq : float
+        Sampling rate of the data.
+
+    filters_freqs : tuple of tuples, shape (n_filters, 2)
+        Cutoff frequencies `(l_freq, h_freq)` of each filter (see `filt`).
+
+    n_times : int
+        Number of time points of the data to be filtered.
+
+    fir_design : str (default: 'firwin')
+        FIR filter design method (see `mne.filter.create_filter`).
+
+    verbose : bool (default: False)
+        Verbosity parameter. If True, info and warnings related to
+        `mne.filter.create_filter` are printed.
+
+    Returns
+    -------
+    h_fft : ndarray, shape (n_filters, n_fft // 2 + 1)
+        Real FFT of the filters.
+
+    n_edge : int
+        Number of samples used to pad the data on each side.
+
+    shift : int
+        Delay (in samples) between the padded data and the filtered data.
+
+    n_fft : int
+        Length of the FFT.
+    """
+    _verbose = 40 * (1 - int(verbose))
+    filters = [create_filter(np.empty((n_times,)), sfreq, l_freq=l_freq,
+                             h_freq=h_freq, fir_design=fir_design,
+                             verbose=_verbose)
+               for l_freq, h_freq in filters_freqs]
+    n_h = max(h.shape[0] for h in filters)
+    h_bank = np.zeros((len(filters), n_h))
+    for j, h in enumerate(filters):
+        start = (n_h - h.shape[0]) // 2
+        h_bank[j, start:(start + h.shape[0])] = h
+    n_edge = max(min(n_h, n_times) - 1, 0)
+    shift = (n_h - 1) // 2 + n_edge
+    n_fft = next_fast_len(n_times + 2 * n_edge + n_h - 1)
+    h_fft = np.fft.rfft(h_bank, n_fft, axis=-1)
+    h_fft.flags.writeable = False
+    return h_fft, n_edge, shift, n_fft
+
+
+def _apply_filter_bank(data, bank):
+    """ Utility function to apply a bank of filters (see `_get_filter_bank`)
+    to the data, in a single pass, by FFT convolution.
+
+    Parameters
+    ----------
+    data : ndarray, shape (n_channels, n_times)
+
+    bank : tuple
+        Output of `_get_filter_bank`.
+
+    Returns
+    -------
+    output : ndarray, shape (n_filters, n_channels, n_times)
+    """
+    h_fft, n_edge, shift, n_fft = bank
+    n_times = data.shape[-1]
+    data_fft = np.fft.rfft(_reflect_pad(data, n_edge), n_fft, axis=-1)
+    h_fft = h_fft.reshape((h_fft.shape[0],) + (1,) * (data.ndim - 1) +
+                          (h_fft.shape[-1],))
+    output = np.fft.irfft(h_fft * data_fft, n_fft, axis=-1)
+    return output[..., shift:(shift + n_times)]
+
+
+def _get_bands_filter_bank(sfreq, freq_bands, n_times):
+    """ Utility function which returns the bank of filters used to filter
+    data in consecutive frequency bands (see `filt_bands`).
+
+    Parameters
+    ----------
+    sfreq : float
+        Sampling rate of the data.
+
+    freq_bands : ndarray, shape (n_freqs,)
+
+    n_times : int
+        Number of time points of the data to be filtered.
+
+    Returns
+    -------
+    bank : tuple
+        Output of `_get_filter_bank`.
+    """
+    _freq_bands = [_as_freq(f) for f in freq_bands]
+    filters_freqs = tuple(zip(_freq_bands[:-1], _freq_bands[1:]))
+    return _get_filter_bank(sfreq, filters_freqs, n_times)
+
+
+def filt_bands(sfreq, data, freq_bands):
+    """ Utility function to filter data in consecutive frequency bands.
+
+    All the frequency bands are filtered in a single pass, in the frequency
+    domain. The filter bank is designed once for each value of `sfreq`,
+    `freq_bands` and `n_times`. For each frequency band, the output is the
+    same as `filt(sfreq, data, [freq_bands[j], freq_bands[j + 1]])`.
+
+    Parameters
+    ----------
+    sfreq : float
+        Sampling rate of the data.
+
+    data : ndarray, shape (n_channels, n_times)
+
+    freq_bands : ndarray, shape (n_freqs,)
+        Array defining the frequency bands. The j-th frequency band is defined
+        as: [freq_bands[j], freq_bands[j + 1]] (0 <= j <= n_freqs - 2).
+
+    Returns
+    -------
+    output : ndarray, shape (n_freqs - 1, n_channels, n_times)
+    """
+    bank = _get_bands_filter_bank(sfreq, freq_bands, data.shape[-1])
+    return _apply_filter_bank(data, bank)
@@ -0,0 +1,254 @@
+# Author: Jean-Baptiste Schiratti <jean.baptiste.schiratti@gmail.com>
+#         Alexandre Gramfort <alexandre.gramfort@inria.fr>
+# License: BSD 3 clause
+
+
+""" Writers used to stream the extracted features to a file (Parquet, Arrow
+IPC or HDF5), chunk by chunk."""
+
+import os
+
+import numpy as np
+
+
+_output_formats = {'.parquet': 'parquet', '.pq': 'parquet',
+                   '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow',
+                   '.h5': 'hdf5', '.hdf5': 'hdf5', '.hdf': 'hdf5'}
+
+
+def _check_output_format(fname):
+    """ Utility function which returns the format of the output file, given
+    its extension.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the output file.
+
+    Returns
+    -------
+    output_format : str
+        'parquet', 'arrow' or 'hdf5'.
+    """
+    ext = os.path.splitext(fname)[1].lower()
+    if ext not in _output_formats:
+        raise ValueError('The format of the output file cannot be inferred '
+                         'from its extension (%s). Valid extensions are: '
+                         '%s.' % (ext, sorted(_output_formats.keys())))
+    return _output_formats[ext]
+
+
+class _ArrowWriter(object):
+    """ Writer of the extracted features to a Parquet or an Arrow IPC file
+    (requires `pyarrow`). Each chunk is written as a row group (Parquet) or
+    as a record batch (Arrow IPC), with one float64 column per feature (and
+    an int64 index column first, if `index_name` is not None).
+
+    Parameters
+    ----------
+    fname : str
+        Path to the output file.
+
+    columns : list of str
+        Names of the features (columns of the output file).
+
+    output_format : str
+        'parquet' or 'arrow'.
+
+    index_name : str or None
+        Name of the index column.
+    """
+    def __init__(self, fname, columns, output_format, index_name):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Writing the features to a %s file requires '
+                              'pyarrow.' % output_format)
+        self._pa = pa
+        fields = [pa.field(name, pa.float64()) for name in columns]
+        if index_name is not None:
+            fields.insert(0, pa.field(index_name, pa.int64()))
+        self.schema = pa.schema(fields)
+        if output_format == 'parquet':
+            self._writer = pq.ParquetWriter(fname, self.schema)
+        else:
+            self._writer = pa.ipc.new_file(fname, self.schema)
+
+    def write(self, X, index):
+        """ Write a chunk of extracted features.
+
+        Parameters
+        ----------
+        X : ndarray, shape (n_epochs_chunk, n_features)
+
+        index : ndarray, shape (n_epochs_chunk,) or None
+        """
+        # Column-major copy, so that each column is a contiguous buffer
+        _X = np.asfortranarray(X, dtype=np.float64)
+        arrays = [self._pa.array(_X[:, j]) for j in range(_X.shape[1])]
+        if index is not None:
+            arrays.insert(0, self._pa.array(np.asarray(index,
+                                                       dtype=np.int64)))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            arrays, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class _HDF5Writer(object):
+    """ Writer of the extracted features to an HDF5 file (requires `h5py`).
+    The features are stored in the resizable dataset 'features', of shape
+    (n_epochs, n_features), and their names in the dataset 'columns'. If
+    `index_name` is not None, the index is stored in the resizable dataset
+    `index_name`, of shape (n_epochs,).
+
+    Parameters
+    ----------
+    fname : str
+        Path to the output file.
+
+    columns : list of str
+        Names of the features.
+
+    index_name : str or None
+        Name of the index dataset.
+    """
+    def __init__(self, fname, columns, index_name):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError('Writing the features to an HDF5 file requires '
+                              'h5py.')
+        self._file = h5py.File(fname, 'w')
+        n_features = len(columns)
+        self._file.create_dataset('columns',
+                                  data=np.array(columns, dtype='S'))
+        self._dataset = self._file.create_dataset(
+            'features', shape=(0, n_features), maxshape=(None, n_features),
+            dtype=np.float64, chunks=True)
+        self._index = None
+        if index_name is not None:
+            self._index = self._file.create_dataset(
+                index_name, shape=(0,), maxshape=(None,), dtype=np.int64,
+                chunks=True)
+
+    def write(self, X, index):
+        """ Write a chunk of extracted features.
+
+        Parameters
+        ----------
+        X : ndarray, shape (n_epochs_chunk, n_features)
+
+        index : ndarray, shape (n_epochs_chunk,) or None
+        """
+        n_epochs = self._dataset.shape[0]
+        self._dataset.resize(n_epochs + X.shape[0], axis=0)
+        self._dataset[n_epochs:] = X
+        if index is not None:
+            self._index.resize(n_epochs + X.shape[0], axis=0)
+            self._index[n_epochs:] = index
+
+    def close(self):
+        self._file.close()
+
+
+class FeatureWriter(object):
+    """ Stream the extracted features to a file, chunk by chunk.
+
+    The format of the file is inferred from its extension: Parquet
+    ('.parquet', '.pq'), Arrow IPC ('.arrow', '.feather', '.ipc') or HDF5
+    ('.h5', '.hdf5', '.hdf'). The columns of the file (names of the
+    features) are set when the writer is created, so that the memory used
+    only depends on the size of the chunks. Parquet and Arrow IPC files are
+    written with `pyarrow` and HDF5 files with `h5py`.
+
+    The features are written to a temporary file (`fname` + '.tmp'), which
+    is renamed `fname` when the writer is closed. When the writer is used as
+    a context manager and an exception is raised within the `with` block,
+    the temporary file is deleted instead: an interrupted extraction never
+    leaves a valid, but incomplete, output file.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the output file.
+
+    columns : list of str
+        Names of the features (for instance, the output of the method
+        `get_feature_names` of the feature extractor).
+
+    index_name : str or None (default: None)
+        If not None, an index (for instance, the indices of the epochs) is
+        written along with the features: as a first int64 column named
+        `index_name` (Parquet and Arrow IPC) or as a dataset named
+        `index_name` (HDF5). The index of each chunk is then passed to
+        `write`.
+    """
+    def __init__(self, fname, columns, index_name=None):
+        self.fname = fname
+        self.columns = list(columns)
+        self.index_name = index_name
+        reserved_names = self.columns + ['features', 'columns']
+        if index_name is not None and index_name in reserved_names:
+            raise ValueError('The name of the index (%s) should differ from '
+                             'the names of the features (and from '
+                             '"features" and "columns").' % index_name)
+        self.output_format = _check_output_format(fname)
+        self._tmp_fname = fname + '.tmp'
+        if self.output_format == 'hdf5':
+            self._writer = _HDF5Writer(self._tmp_fname, self.columns,
+                                       index_name)
+        else:
+            self._writer = _ArrowWriter(self._tmp_fname, self.columns,
+                                        self.output_format, index_name)
+        self.n_epochs_ = 0
+
+    def write(self, X, index=None):
+        """ Write a chunk of extracted features.
+
+        Parameters
+        ----------
+        X : ndarray, shape (n_epochs_chunk, n_features)
+
+        index : array-like, shape (n_epochs_chunk,) or None (default: None)
+            Index of the rows of X. It should be given if and only if the
+            writer was created with an `index_name`.
+        """
+        if X.ndim != 2 or X.shape[1] != len(self.columns):
+            raise ValueError('The chunk of features should be of shape '
+                             '(n_epochs_chunk, %d). Got %s.' %
+                             (len(self.columns), X.shape))
+        if (index is None) != (self.index_name is None):
+            raise ValueError('The index of the chunk should be given if and '
+                             'only if the writer has an `index_name`.')
+        if index is not None and np.shape(index) != (X.shape[0],):
+            raise ValueError('The index of the chunk should be of shape '
+                             '(%d,). Got %s.' % (X.shape[0], np.shape(index)))
+        self._writer.write(X, index)
+        self.n_epochs_ += X.shape[0]
+
+    def close(self):
+        """ Close the output file (the temporary file is renamed `fname`). """
+        self._writer.close()
+        # `os.replace` is not available in Python 2 (where `os.rename`
+        # replaces the file on POSIX systems)
+        getattr(os, 'replace', os.rename)(self._tmp_fname, self.fname)
+
+    def _discard(self):
+        """ Close and delete the temporary file. """
+        try:
+            self._writer.close()
+        finally:
+            if os.path.exists(self._tmp_fname):
+                os.remove(self._tmp_fname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
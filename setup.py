@@ -59,5 +59,7 @@ if __name__ == "__main__":
           platforms='any',
           packages=package_tree('mne_features'),
           install_requires=['numpy', 'scipy', 'numba', 'scikit-learn', 'mne',
-                            'PyWavelets', 'pandas']
+                            'PyWavelets', 'pandas'],
+          entry_points={'console_scripts': [
+              'mne-features = mne_features.cli:main']}
           )